@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""Time ytls against a local fake YouTube API, without network or quota."""
+
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from time import perf_counter
+
+from fake_youtube_api import FakeYouTube, serve
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def timed(timings, name, function, *args, **kwargs):
+    start = perf_counter()
+    result = function(*args, **kwargs)
+    timings[name] = perf_counter() - start
+    return result
+
+
+def run_session():
+    '''
+    Fetch, sort and list videos in this process, print timings as JSON.
+
+    Expects the cache directory, API url and working directory to be set
+    up by `benchmark()`.
+    '''
+    timings = dict()
+
+    timed(timings, 'import', __import__, 'ytls')
+    ytls = sys.modules['ytls']
+
+    # The fake server has no quota to protect.
+    ytls.YouTubeAPI.bucket = ytls.TokenBucket(rate=1e9, capacity=1e9)
+    ytls.SETTINGS.DAILY_QUOTA = 10 ** 9
+
+    with redirect_stdout(io.StringIO()):
+        videos = timed(timings, 'fetch', lambda: list(
+            ytls.get_videos(ytls.parse_config_file())
+        ))
+
+    ytls.VIDEOS = videos
+    ytls.cols = 160
+
+    timed(timings, 'sort', lambda: (
+        ytls.Sorted(videos).by_date.by_time.get(),
+        ytls.Sorted(videos).by_user.get(),
+        ytls.Sorted(videos).by_views.get(),
+    ))
+
+    with redirect_stdout(io.StringIO()):
+        timed(timings, 'list', ytls.list_videos, videos)
+
+    timings['videos'] = len(videos)
+
+    print(json.dumps(timings))
+
+
+def session(workdir, api_url):
+    env = dict(
+        os.environ,
+        XDG_CACHE_HOME=os.path.join(workdir, 'cache'),
+        YTLS_API_URL=api_url,
+        YTLS_API_BACKEND='rest',
+        PYTHONPATH=HERE,
+    )
+
+    output = subprocess.run(
+        [sys.executable, os.path.join(HERE, 'benchmark.py'), '--session'],
+        cwd=workdir, env=env, check=True, capture_output=True, text=True,
+    ).stdout
+
+    return json.loads(output.splitlines()[-1])
+
+
+def benchmark(channels, videos_per_channel, uploads, latency, error_rate=0.0):
+    '''
+    Run a cold session (empty cache) followed by a warm one against a
+    fresh fake server with `channels` subscriptions.
+    '''
+    youtube = FakeYouTube(
+        channels=channels, uploads=uploads, latency=latency, error_rate=error_rate,
+    )
+    server = serve(youtube)
+    api_url = f'http://127.0.0.1:{server.server_port}/youtube/v3'
+
+    with tempfile.TemporaryDirectory() as workdir:
+        with open(os.path.join(workdir, 'API_KEY'), 'w') as key:
+            key.write('benchmark\n')
+
+        with open(os.path.join(workdir, 'subscriptions.conf'), 'w') as conf:
+            for channel in range(channels):
+                conf.write(f'd\t{videos_per_channel}\tuser{channel}\n')
+
+        cold = session(workdir, api_url)
+        cold_requests = youtube.requests
+        warm = session(workdir, api_url)
+
+    server.shutdown()
+    server.server_close()
+
+    return {
+        'channels': channels,
+        'videos': warm['videos'],
+        'cold_fetch': cold['fetch'],
+        'cold_requests': cold_requests,
+        'warm_fetch': warm['fetch'],
+        'warm_requests': youtube.requests - cold_requests,
+        'sort': warm['sort'],
+        'list': warm['list'],
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--channels', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--videos', type=int, default=5,
+                        help='videos listed per channel')
+    parser.add_argument('--uploads', type=int, default=50,
+                        help='uploads per channel on the fake server')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='simulated seconds per API request')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='fraction of API requests failing with a 503')
+    parser.add_argument('--json', action='store_true',
+                        help='print results as JSON lines')
+    parser.add_argument('--session', action='store_true',
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.session:
+        run_session()
+        sys.exit()
+
+    if not args.json:
+        print(f'{"CHANNELS":>8} {"VIDEOS":>7} {"COLD FETCH":>11} {"REQS":>6} '
+              f'{"WARM FETCH":>11} {"REQS":>6} {"SORT":>9} {"LIST":>9}')
+
+    for channels in args.channels:
+        result = benchmark(
+            channels, args.videos, args.uploads, args.latency, args.error_rate,
+        )
+
+        if args.json:
+            print(json.dumps(result))
+            continue
+
+        print(f'{result["channels"]:>8} {result["videos"]:>7} '
+              f'{result["cold_fetch"] * 1000:>9.1f}ms {result["cold_requests"]:>6} '
+              f'{result["warm_fetch"] * 1000:>9.1f}ms {result["warm_requests"]:>6} '
+              f'{result["sort"] * 1000:>7.1f}ms {result["list"] * 1000:>7.1f}ms')
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""A local stand-in for the parts of the YouTube Data API v3 ytls uses."""
+
+import argparse
+import gzip
+import json
+import random
+import threading
+from datetime import datetime, timedelta
+from hashlib import md5
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep
+from urllib.parse import parse_qsl, urlsplit
+
+
+class FakeYouTube:
+    '''
+    Synthetic, deterministic channels, uploads and video details.
+
+    Channel N has username `userN` and id `UC` followed by N zero padded
+    to 22 digits. Its uploads are numbered from 0 (the newest), one every
+    `upload_interval` hours.
+    '''
+    epoch = datetime(2020, 10, 1)
+    upload_interval = 7
+
+    def __init__(self, channels=100, uploads=50, latency=0.0, error_rate=0.0):
+        self.channels = channels
+        self.uploads = uploads
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def channel_id(self, channel):
+        return f'UC{channel:022d}'
+
+    def video_id(self, channel, upload):
+        return f'{channel:05d}{upload:06d}'
+
+    def published_at(self, channel, upload):
+        published = self.epoch - timedelta(hours=(upload * self.upload_interval) + (channel % 24))
+        return published.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    def snippet(self, channel, upload):
+        return {
+            'publishedAt': self.published_at(channel, upload),
+            'channelId': self.channel_id(channel),
+            'title': f'Upload {upload} of channel {channel}',
+            'description': f'Description of upload {upload} of channel {channel}. ' * 10,
+            'channelTitle': f'Channel {channel}',
+            'thumbnails': {
+                size: {'url': f'https://i.ytimg.com/vi/{self.video_id(channel, upload)}/{size}.jpg'}
+                for size in ('default', 'medium', 'high')
+            },
+        }
+
+    def channels_list(self, params):
+        username = params.get('forUsername', '')
+        items = []
+
+        if username.startswith('user') and username[4:].isdigit():
+            channel = int(username[4:])
+            if channel < self.channels:
+                items.append({'kind': 'youtube#channel', 'id': self.channel_id(channel)})
+
+        return {'kind': 'youtube#channelListResponse', 'items': items}
+
+    def playlistItems_list(self, params):
+        channel = int(params['playlistId'][2:])
+        start = int(params.get('pageToken', 0))
+        max_results = min(int(params.get('maxResults', 5)), 50)
+        stop = min(start + max_results, self.uploads)
+
+        items = []
+
+        for upload in range(start, stop):
+            snippet = self.snippet(channel, upload)
+            snippet['resourceId'] = {
+                'kind': 'youtube#video',
+                'videoId': self.video_id(channel, upload),
+            }
+            items.append({
+                'kind': 'youtube#playlistItem',
+                'snippet': snippet,
+                'contentDetails': {
+                    'videoId': self.video_id(channel, upload),
+                    'videoPublishedAt': snippet['publishedAt'],
+                },
+            })
+
+        response = {'kind': 'youtube#playlistItemListResponse', 'items': items}
+
+        if stop < self.uploads:
+            response['nextPageToken'] = str(stop)
+
+        return response
+
+    def videos_list(self, params):
+        items = []
+
+        for video_id in params.get('id', '').split(',')[:50]:
+            channel, upload = int(video_id[:5]), int(video_id[5:])
+            views = (channel * 7919 + upload * 104729) % 1000000
+
+            items.append({
+                'kind': 'youtube#video',
+                'id': video_id,
+                'snippet': self.snippet(channel, upload),
+                'contentDetails': {'duration': f'PT{upload % 60}M{channel % 60}S'},
+                'statistics': {
+                    'viewCount': str(views),
+                    'likeCount': str(views // 20),
+                    'dislikeCount': str(views // 400),
+                    'commentCount': str(views // 100),
+                },
+            })
+
+        return {'kind': 'youtube#videoListResponse', 'items': items}
+
+    def handle(self, resource, params):
+        '''
+        Return (status, response body) for a request.
+        '''
+        with self.lock:
+            self.requests += 1
+
+        if self.latency:
+            sleep(self.latency)
+
+        if random.random() < self.error_rate:
+            return 503, {'error': {
+                'code': 503,
+                'message': 'The service is currently unavailable.',
+                'errors': [{'reason': 'backendError'}],
+            }}
+
+        handler = {
+            'channels': self.channels_list,
+            'playlistItems': self.playlistItems_list,
+            'videos': self.videos_list,
+        }.get(resource)
+
+        if handler is None:
+            return 404, {'error': {
+                'code': 404,
+                'message': 'Not Found',
+                'errors': [{'reason': 'notFound'}],
+            }}
+
+        response = handler(params)
+        response['etag'] = md5(json.dumps(response, sort_keys=True).encode()).hexdigest()
+
+        return 200, response
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        resource = url.path.rstrip('/').rsplit('/', 1)[-1]
+
+        status, response = self.server.youtube.handle(resource, dict(parse_qsl(url.query)))
+
+        if status == 200 and self.headers.get('If-None-Match') == response['etag']:
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        body = json.dumps(response).encode()
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body, compresslevel=1)
+            self.send_header('Content-Encoding', 'gzip')
+
+        if status == 200:
+            self.send_header('ETag', response['etag'])
+
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(youtube, host='127.0.0.1', port=0):
+    '''
+    Serve `youtube` from a background thread, and return the server.
+
+    The API base url is `http://{host}:{server.server_port}/youtube/v3`.
+    '''
+    server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.daemon_threads = True
+    server.youtube = youtube
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--channels', type=int, default=100)
+    parser.add_argument('--uploads', type=int, default=50,
+                        help='uploads per channel')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds to wait before answering a request')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='fraction of requests answered with a 503')
+    args = parser.parse_args()
+
+    server = serve(
+        FakeYouTube(args.channels, args.uploads, args.latency, args.error_rate),
+        host=args.host,
+        port=args.port,
+    )
+
+    print(f'YTLS_API_URL=http://{args.host}:{server.server_port}/youtube/v3')
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
@@ -1,16 +1,22 @@
 #!/usr/bin/env python3
 """Get the latest N uploads from a list of channels."""
 
+from time import perf_counter
+
+IMPORT_STARTED = perf_counter()
+
 import os
-import pickle
 import re
-import readline
 import string
-from pprint import pprint
+import threading
+from bisect import bisect_right
+from collections import defaultdict
+from functools import lru_cache
+from operator import attrgetter, itemgetter
 from shlex import quote as shellescape
 from shutil import which
-from sys import stderr, stdout
-from time import sleep, strftime
+from sys import intern, stderr, stdout
+from time import localtime, monotonic, sleep, strftime, time
 
 BROWSER = os.getenv('BROWSER', default='firefox')
 HOME = os.getenv('HOME')
@@ -19,11 +25,27 @@ XDG_DOWNLOADS_DIR = os.getenv('XDG_DOWNLOADS_DIR', default=os.path.join(HOME, 'D
 
 
 class Settings():
+    API_BACKEND = os.getenv('YTLS_API_BACKEND', default='rest')
+    API_URL = os.getenv('YTLS_API_URL', default='https://www.googleapis.com/youtube/v3')
+    TRACE_FILE = os.getenv('YTLS_TRACE')
     VIDS_REQUESTED_PER_CHANNEL = 50
+    INCREMENTAL_PAGE_SIZE = 5
+    WORKERS = 8
+    DOWNLOAD_WORKERS = 2
+    PREFETCH_INTERVAL = 5 * 60
+    STATS_MAX_AGE = 24 * 60 * 60
+    REQUEST_BURST = 500
+    DAILY_QUOTA = 10000
+    QUOTA_RESERVE = 1000
+    CACHE_MAX_BYTES = 256 * 1024 * 1024
+    CACHE_TTL = 30 * 24 * 60 * 60
+    VIEW_JOURNAL_MAX_BYTES = 64 * 1024
     DEBUG = False
     HIDE = False
     KEYWORDS = set()
+    KEYWORDS_PATTERN = None
     SHOW_URL = False
+    STREAM = False
 
 
 color_codes = {
@@ -45,506 +67,3085 @@ def colored(viewed=False, color_key=None, string=''):
     return string
 
 
-def debug(string):
-    if SETTINGS.DEBUG:
-        stderr.write(f'\n[{colored(viewed=False, color_key="debug", string="DEBUG")}] {string}\n')
+def debug(string):
+    if SETTINGS.DEBUG:
+        stderr.write(f'\n[{colored(viewed=False, color_key="debug", string="DEBUG")}] {string}\n')
+
+
+background = threading.local()
+
+
+def status(string):
+    '''
+    Tell the user what we are waiting for, unless working in the background.
+    '''
+    if not getattr(background, 'quiet', False):
+        stdout.write(f'{string}\n')
+
+
+def concurrent_map(function, iterable):
+    '''
+    Like `map()`, but runs up to `SETTINGS.WORKERS` calls at a time.
+
+    Results are returned in the order of `iterable`.
+    '''
+    if SETTINGS.WORKERS <= 1:
+        return list(map(function, iterable))
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    # Workers are as quiet as the thread they work for.
+    quiet = getattr(background, 'quiet', False)
+
+    with ThreadPoolExecutor(
+        max_workers=SETTINGS.WORKERS,
+        initializer=setattr, initargs=(background, 'quiet', quiet),
+    ) as pool:
+        return list(pool.map(function, iterable))
+
+
+class Timer:
+    '''
+    Context manager recording how long its block took, see `Metrics.timer()`.
+    '''
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.record(self.stage, perf_counter() - self.started)
+
+
+class Metrics:
+    '''
+    Calls of, and time spent in, each stage of ytls, and counters of
+    events such as cache hits. See the `stats` command.
+
+    Stages run concurrently add up, so their total may exceed the wall
+    clock time of the command that ran them. If `SETTINGS.TRACE_FILE` is
+    set, every timed call is also appended to it as a line of JSON.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.trace = None
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.timings = dict()
+            self.counters = defaultdict(int)
+
+    def timer(self, stage):
+        return Timer(self, stage)
+
+    def count(self, counter, n=1):
+        with self.lock:
+            self.counters[counter] += n
+
+    def record(self, stage, seconds):
+        with self.lock:
+            calls, total, longest = self.timings.get(stage, (0, 0, 0))
+            self.timings[stage] = (calls + 1, total + seconds, max(longest, seconds))
+
+            if SETTINGS.TRACE_FILE:
+                self.write_trace(stage, seconds)
+
+    def write_trace(self, stage, seconds):
+        import json
+
+        if self.trace is None:
+            self.trace = open(SETTINGS.TRACE_FILE, 'a', buffering=1)
+
+        self.trace.write(json.dumps({
+            'stage': stage,
+            'start': time() - seconds,
+            'seconds': seconds,
+            'thread': threading.current_thread().name,
+        }) + '\n')
+
+    def report(self):
+        with self.lock:
+            timings = sorted(self.timings.items(), key=lambda t: -t[1][1])
+            counters = sorted(self.counters.items())
+
+        stdout.write(f'{"STAGE":<28} {"CALLS":>8} {"TOTAL":>10} {"MEAN":>10} {"MAX":>10}\n')
+        for stage, (calls, total, longest) in timings:
+            stdout.write(f'{stage:<28} {calls:>8} {total * 1000:>8.1f}ms '
+                         f'{total / calls * 1000:>8.2f}ms {longest * 1000:>8.1f}ms\n')
+
+        stdout.write(f'\n{"COUNTER":<28} {"COUNT":>8}\n')
+        for counter, count in counters:
+            stdout.write(f'{counter:<28} {count:>8}\n')
+
+
+class TokenBucket:
+    '''
+    Thread safe token bucket, refilled at `rate` tokens per second up to
+    `capacity` tokens.
+    '''
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = monotonic()
+        self.tokens = min(
+            self.capacity,
+            self.tokens + ((now - self.updated) * self.rate),
+        )
+        self.updated = now
+
+    def reserve(self, tokens=1):
+        '''
+        Take `tokens`, and return how many seconds to wait before using them.
+        '''
+        with self.lock:
+            self.refill()
+            self.tokens -= tokens
+            return max(0, -self.tokens / self.rate)
+
+    def take(self, tokens=1):
+        wait = self.reserve(tokens)
+
+        if wait:
+            sleep(wait)
+
+    def set_rate(self, rate):
+        with self.lock:
+            self.refill()
+            self.rate = rate
+
+    def available(self):
+        with self.lock:
+            return min(
+                self.capacity,
+                self.tokens + ((monotonic() - self.updated) * self.rate),
+            )
+
+
+class FileLock:
+    '''
+    An advisory lock on `path` (see flock(2)), held for a `with` block.
+
+    Shared locks exclude exclusive ones only. Every `with` block opens the
+    file anew, so threads of one process exclude each other as well.
+    '''
+    def __init__(self, path, shared=False):
+        self.path = path
+        self.shared = shared
+        self.fd = None
+
+    def __enter__(self):
+        import fcntl
+
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self.fd, fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        os.close(self.fd)
+        self.fd = None
+
+
+class CacheStore:
+    '''
+    Every cached object, pickled in one SQLite database shared by all ytls
+    processes, keyed by the kind of entity and its id.
+    '''
+    max_keys_per_query = 500
+
+    # In WAL mode readers never wait for a writer; writers wait this many
+    # seconds for each other.
+    busy_timeout = 30
+
+    # Reading an entry bumps its `accessed` time at most this often. Reads
+    # never write: bumped times wait in memory for the next write.
+    access_resolution = 60 * 60
+
+    # One script per schema version, see `PRAGMA user_version`.
+    schema = [
+        '''
+        CREATE TABLE IF NOT EXISTS cache (
+            kind TEXT NOT NULL,
+            key  TEXT NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (kind, key)
+        ) WITHOUT ROWID;
+        ''',
+        '''
+        ALTER TABLE cache ADD COLUMN size INTEGER NOT NULL DEFAULT 0;
+        ALTER TABLE cache ADD COLUMN accessed REAL NOT NULL DEFAULT 0;
+        ALTER TABLE cache ADD COLUMN expires REAL;
+        UPDATE cache SET size = length(data), accessed = strftime('%s', 'now');
+        UPDATE cache SET expires = accessed + 30 * 24 * 60 * 60
+            WHERE kind != 'state';
+        CREATE INDEX cache_expires ON cache (expires);
+        CREATE INDEX cache_accessed ON cache (accessed);
+        PRAGMA auto_vacuum = INCREMENTAL;
+        VACUUM;
+        ''',
+        '''
+        ALTER TABLE cache ADD COLUMN written REAL NOT NULL DEFAULT 0;
+        UPDATE cache SET written = accessed;
+        ''',
+    ]
+
+    def __init__(self, path):
+        import sqlite3
+
+        self.path = path
+        self.lock = threading.Lock()
+        self.accessed = dict()
+        self.db = sqlite3.connect(path, timeout=self.busy_timeout, check_same_thread=False)
+
+        with self.lock:
+            version, = self.db.execute('PRAGMA user_version').fetchone()
+
+            for version, script in enumerate(self.schema[version:], version + 1):
+                self.db.executescript(f'{script}; PRAGMA user_version = {version};')
+
+            self.db.execute('PRAGMA journal_mode = WAL')
+            self.db.execute('PRAGMA synchronous = NORMAL')
+
+    def get_many(self, kind, keys):
+        import pickle
+
+        keys = list(keys)
+        now = time()
+        rows = []
+
+        with METRICS.timer(f'cache read {kind}'), self.lock:
+            for start in range(0, len(keys), self.max_keys_per_query):
+                batch = keys[start:start + self.max_keys_per_query]
+                placeholders = ', '.join('?' * len(batch))
+
+                for key, blob, accessed in self.db.execute(
+                    'SELECT key, data, accessed FROM cache '
+                    f'WHERE kind = ? AND key IN ({placeholders})',
+                    (kind, *batch),
+                ):
+                    rows.append((key, blob))
+
+                    if accessed < now - self.access_resolution:
+                        self.accessed[kind, key] = now
+
+        data = dict()
+
+        with METRICS.timer(f'unpickle {kind}'):
+            for key, blob in rows:
+                try:
+                    data[key] = pickle.loads(blob)
+                except (EOFError, ValueError, LookupError, pickle.UnpicklingError):
+                    # Imported from a pickle file that was half written.
+                    continue
+
+        METRICS.count(f'cache hit {kind}', len(data))
+        METRICS.count(f'cache miss {kind}', len(keys) - len(data))
+
+        return data
+
+    def put_many(self, kind, data, ttl=None):
+        import pickle
+
+        now = time()
+        expires = None if ttl is None else now + ttl
+        rows = []
+
+        for key, value in data.items():
+            blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            rows.append((kind, key, blob, len(blob), now, now, expires))
+
+        with METRICS.timer(f'cache write {kind}'), self.lock, self.db:
+            self.db.executemany(
+                'INSERT OR REPLACE INTO cache '
+                '(kind, key, data, size, accessed, written, expires) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                rows,
+            )
+            self.write_accessed()
+
+    def write_accessed(self):
+        '''
+        Write the access times bumped by `get_many()` since the last write.
+        Must be called in a transaction, with `lock` held.
+        '''
+        self.db.executemany(
+            'UPDATE cache SET accessed = ? WHERE kind = ? AND key = ? AND accessed < ?',
+            ((now, kind, key, now) for (kind, key), now in self.accessed.items()),
+        )
+        self.accessed.clear()
+
+    def update(self, kind, key, function, ttl=None):
+        '''
+        Replace the entry `key` with `function(value)`, where value is None
+        if there is no such entry, and return the new value.
+
+        No other process can write to the store in the meantime, so their
+        changes are never lost, nor lose ours. `function` must not use the
+        store itself.
+        '''
+        import pickle
+
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+
+            try:
+                row = self.db.execute(
+                    'SELECT data FROM cache WHERE kind = ? AND key = ?', (kind, key)
+                ).fetchone()
+
+                try:
+                    value = None if row is None else pickle.loads(row[0])
+                except (EOFError, ValueError, LookupError, pickle.UnpicklingError):
+                    value = None
+
+                value = function(value)
+
+                now = time()
+                blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+                self.db.execute(
+                    'INSERT OR REPLACE INTO cache '
+                    '(kind, key, data, size, accessed, written, expires) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (kind, key, blob, len(blob), now, now, None if ttl is None else now + ttl),
+                )
+            except BaseException:
+                self.db.rollback()
+                raise
+
+            self.db.commit()
+
+        return value
+
+    def prune(self, max_bytes):
+        '''
+        Delete expired entries, then the least recently used evictable
+        entries until the store holds at most `max_bytes` of data.
+
+        Returns the number of entries deleted.
+        '''
+        with self.lock, self.db:
+            self.write_accessed()
+
+            deleted = self.db.execute(
+                'DELETE FROM cache WHERE expires < ?', (time(),)
+            ).rowcount
+
+            total, = self.db.execute(
+                'SELECT coalesce(sum(size), 0) FROM cache'
+            ).fetchone()
+
+            if total > max_bytes:
+                evict = []
+
+                for kind, key, size in self.db.execute(
+                    'SELECT kind, key, size FROM cache '
+                    'WHERE expires IS NOT NULL ORDER BY accessed'
+                ):
+                    if total <= max_bytes:
+                        break
+                    total -= size
+                    evict.append((kind, key))
+
+                self.db.executemany(
+                    'DELETE FROM cache WHERE kind = ? AND key = ?', evict
+                )
+                deleted += len(evict)
+
+        # `execute()` would only step the pragma once, freeing one page.
+        # The file shrinks once the WAL is checkpointed.
+        with self.lock:
+            self.db.executescript(
+                'PRAGMA incremental_vacuum; PRAGMA wal_checkpoint(TRUNCATE);'
+            )
+
+        return deleted
+
+    def missing(self, kind, keys):
+        '''
+        Return the keys in `keys` that have no entry, without reading any.
+        '''
+        keys = list(keys)
+        found = set()
+
+        with self.lock:
+            for start in range(0, len(keys), self.max_keys_per_query):
+                batch = keys[start:start + self.max_keys_per_query]
+                placeholders = ', '.join('?' * len(batch))
+
+                found.update(key for key, in self.db.execute(
+                    f'SELECT key FROM cache WHERE kind = ? AND key IN ({placeholders})',
+                    (kind, *batch),
+                ))
+
+        return [key for key in keys if key not in found]
+
+    def written(self, kind, key):
+        '''
+        When the entry `key` was last written, by any process, or None if
+        there is no such entry.
+        '''
+        with self.lock:
+            row = self.db.execute(
+                'SELECT written FROM cache WHERE kind = ? AND key = ?', (kind, key)
+            ).fetchone()
+
+        return None if row is None else row[0]
+
+    def stats(self):
+        '''
+        Return (kind, entries, bytes, expired entries) for each kind.
+        '''
+        with self.lock:
+            return self.db.execute(
+                'SELECT kind, count(*), sum(size), '
+                'coalesce(sum(expires < ?), 0) '
+                'FROM cache GROUP BY kind ORDER BY kind',
+                (time(),),
+            ).fetchall()
+
+    def migrate(self, directory):
+        '''
+        Import the one-pickle-per-object files used by older versions of
+        ytls, then remove them.
+        '''
+        pickles = [f for f in os.listdir(directory) if f.endswith('.pkl')]
+        now = time()
+        rows = []
+
+        for filename in pickles:
+            key = filename[:-len('.pkl')]
+            entity_id = key.split('.')[0]
+
+            expires = now + SETTINGS.CACHE_TTL
+
+            if key in ('channel_ids', 'view_history'):
+                kind = 'state'
+                expires = None
+            elif entity_id.startswith('UC') and len(entity_id) == 24:
+                if key != entity_id:
+                    # Uploads are no longer kept per time bucket, so these
+                    # would never be read.
+                    continue
+                kind = 'uploads'
+            else:
+                kind = 'details'
+
+            with open(os.path.join(directory, filename), 'rb') as cache:
+                blob = cache.read()
+
+            rows.append((kind, key, blob, len(blob), now, now, expires))
+
+        if rows:
+            with self.lock, self.db:
+                self.db.executemany(
+                    'INSERT OR IGNORE INTO cache '
+                    '(kind, key, data, size, accessed, written, expires) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    rows,
+                )
+
+        for filename in pickles:
+            os.remove(os.path.join(directory, filename))
+
+
+class Cachable:
+    '''
+    Cache data on disk for faster lookups / persistent session state
+
+    Subclasses set `cache_kind` to keep their keys apart in the store,
+    and `cache_expires` if their entries may be evicted.
+    '''
+    cache_base = os.path.join(XDG_CACHE_HOME, 'youtube_api_v3')
+    cache_kind = 'state'
+    cache_expires = False
+
+    _store = None
+    _store_lock = threading.Lock()
+
+    @property
+    def store(self):
+        with Cachable._store_lock:
+            if Cachable._store is None:
+                os.makedirs(self.cache_base, exist_ok=True)
+                path = os.path.join(self.cache_base, 'cache.sqlite3')
+
+                # Only one process at a time creates, upgrades or imports
+                # into the store.
+                with FileLock(f'{path}.lock'):
+                    store = CacheStore(path)
+                    store.migrate(self.cache_base)
+
+                Cachable._store = store
+
+        return Cachable._store
+
+    def load_cache(self, cache_name, default=None):
+        cache_data = self.load_many([cache_name]).get(cache_name, None)
+
+        if cache_data is None:
+            return default
+        return cache_data
+
+    def save_cache(self, cache_name, data=None):
+        if data is not None:
+            self.save_many({cache_name: data})
+
+    def load_many(self, cache_names):
+        return self.store.get_many(self.cache_kind, cache_names)
+
+    def save_many(self, data):
+        if data:
+            ttl = SETTINGS.CACHE_TTL if self.cache_expires else None
+            self.store.put_many(self.cache_kind, data, ttl=ttl)
+
+    def update_cache(self, cache_name, function):
+        '''
+        Save `function(cached data)` in one transaction, see `CacheStore.update()`.
+        '''
+        ttl = SETTINGS.CACHE_TTL if self.cache_expires else None
+        return self.store.update(self.cache_kind, cache_name, function, ttl=ttl)
+
+
+class CacheManager(Cachable):
+    '''
+    Keep the cache within `SETTINGS.CACHE_TTL` and `SETTINGS.CACHE_MAX_BYTES`.
+    '''
+    def prune(self):
+        return self.store.prune(SETTINGS.CACHE_MAX_BYTES)
+
+    def prune_in_background(self):
+        threading.Thread(target=self.prune, daemon=True).start()
+
+    def stats(self):
+        stats = self.store.stats()
+        disk_usage = sum(
+            os.path.getsize(path)
+            for path in (self.store.path, f'{self.store.path}-wal')
+            if os.path.exists(path)
+        )
+
+        stdout.write(f'{"KIND":<10} {"ENTRIES":>8} {"SIZE":>12} {"EXPIRED":>8}\n')
+        for kind, entries, size, expired in stats:
+            stdout.write(f'{kind:<10} {entries:>8} {size:>12} {expired:>8}\n')
+        stdout.write(f'\n{disk_usage} bytes on disk, '
+                     f'limit {SETTINGS.CACHE_MAX_BYTES} bytes\n')
+
+
+class RestRequest:
+    '''
+    A pending request, see `RestAPI`.
+    '''
+    def __init__(self, api, resource, params):
+        self.api = api
+        self.resource = resource
+        self.params = params
+        self.headers = dict()
+
+    def execute(self):
+        return self.api.request(self.resource, self.params, self.headers)
+
+
+class RestResource:
+    def __init__(self, api, resource):
+        self.api = api
+        self.resource = resource
+
+    def list(self, **params):
+        return RestRequest(self.api, self.resource, params)
+
+
+class RestAPI:
+    '''
+    Minimal client for the YouTube Data API endpoints ytls uses, called
+    the same way as the googleapiclient resource:
+
+        RestAPI(key).videos().list(part='snippet', id=video_id).execute()
+
+    Thread safe. Requests go over keep-alive connections, kept in a pool
+    once their request is done, so one client is shared by every thread
+    and its connections outlive the threads that opened them. A pooled
+    connection the server closed in the meantime is replaced by a new one.
+    '''
+    def __init__(self, developer_key, base_url):
+        from urllib.parse import urlsplit
+
+        url = urlsplit(base_url)
+
+        self.developer_key = developer_key
+        self.scheme = url.scheme
+        self.netloc = url.netloc
+        self.path = url.path.rstrip('/')
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def channels(self):
+        return RestResource(self, 'channels')
+
+    def playlistItems(self):
+        return RestResource(self, 'playlistItems')
+
+    def videos(self):
+        return RestResource(self, 'videos')
+
+    def connect(self, reuse=True):
+        '''
+        Take an idle connection from the pool, or open a new one.
+        '''
+        with self.lock:
+            if reuse and self.connections:
+                return self.connections.pop()
+
+        from http.client import HTTPConnection, HTTPSConnection
+
+        if self.scheme == 'http':
+            return HTTPConnection(self.netloc, timeout=30)
+        return HTTPSConnection(self.netloc, timeout=30)
+
+    def release(self, connection):
+        with self.lock:
+            self.connections.append(connection)
+
+    def request(self, resource, params, headers):
+        import json
+        from http.client import HTTPException
+        from urllib.parse import urlencode
+
+        query = urlencode({
+            **{k: v for k, v in params.items() if v is not None},
+            'key': self.developer_key,
+        })
+
+        headers = {'Accept-Encoding': 'gzip', **headers}
+
+        for retry in (True, False):
+            connection = self.connect(reuse=retry)
+            try:
+                connection.request('GET', f'{self.path}/{resource}?{query}', headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+                break
+            except (HTTPException, OSError):
+                connection.close()
+                if not retry:
+                    raise
+
+        self.release(connection)
+
+        if response.getheader('Content-Encoding') == 'gzip':
+            import gzip
+            body = gzip.decompress(body)
+
+        if response.status >= 300:
+            try:
+                error = json.loads(body)['error']
+                message = error['message']
+                reason = error['errors'][0]['reason']
+            except (ValueError, LookupError, TypeError):
+                message, reason = response.reason, ''
+            raise APIError(response.status, message, reason=reason)
+
+        return json.loads(body)
+
+
+class LazyLoaded:
+    '''
+    The Google API lib is slooooooooooow to import,
+    this class lazily loads it with the lazy() method.
+
+    By default the built-in `RestAPI` client is used instead; set
+    YTLS_API_BACKEND=googleapiclient to go through the Google API lib.
+
+    The `RestAPI` client is shared by every thread. The Google API lib is
+    not thread safe, so every thread gets its own instance of it.
+    '''
+    _local = threading.local()
+    _rest_api = None
+    _rest_api_lock = threading.Lock()
+
+    def lazy(self):
+        if SETTINGS.API_BACKEND == 'googleapiclient':
+            api = getattr(self._local, 'api', None)
+
+            if api is None:
+                from googleapiclient.discovery import build
+                api = self._local.api = build('youtube', 'v3', developerKey=read_api_key())
+
+            return api
+
+        if LazyLoaded._rest_api is None:
+            with LazyLoaded._rest_api_lock:
+                if LazyLoaded._rest_api is None:
+                    LazyLoaded._rest_api = RestAPI(read_api_key(), SETTINGS.API_URL)
+
+        return LazyLoaded._rest_api
+
+
+@lru_cache(maxsize=1)
+def read_api_key(path='API_KEY'):
+    with open(path, 'r') as key:
+        return key.read().strip()
+
+
+def video_id(playlist_item):
+    return playlist_item['snippet']['resourceId']['videoId']
+
+
+class APIError(Exception):
+    '''
+    An HTTP error response from the YouTube API.
+    '''
+    def __init__(self, status, message='', reason=''):
+        super().__init__(f'{status}: {message}')
+        self.status = status
+        self.message = message
+        self.reason = reason
+
+
+class QuotaExceeded(APIError):
+    '''
+    The daily quota is used up, by the API's count or by our own.
+    '''
+
+
+class Stopped(Exception):
+    '''
+    ytls is shutting down, see `YouTubeAPI.stopped`.
+    '''
+
+
+class Quota(Cachable):
+    '''
+    Account for the units of the daily API quota spent on each endpoint.
+
+    Every `list` call costs `costs[endpoint]` units. Usage is kept per day
+    for `history_days` days, in Pacific time, since that is when the quota
+    is reset. Units are counted in memory, and added to the saved ledger
+    every `save_every` units and on exit.
+
+    The request rate follows what is left of the budget: the shared token
+    bucket is refilled at the rate that would spend the remaining units
+    over `max_duty_cycle` of the rest of the day. Once the budget is spent,
+    or the API answers "quotaExceeded", requests fail with `QuotaExceeded`
+    until the quota is reset.
+    '''
+    costs = {'channels': 1, 'playlistItems': 1, 'videos': 1}
+    history_days = 30
+    save_every = 100
+    max_duty_cycle = (1 / 3)
+
+    def __init__(self):
+        self.cache_name = 'quota'
+        self.ledger = None
+        self.unsaved = defaultdict(int)
+        self.warned = None
+        self.unwarned = None
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def now():
+        from datetime import datetime, timedelta, timezone
+
+        try:
+            from zoneinfo import ZoneInfo
+            return datetime.now(ZoneInfo('America/Los_Angeles'))
+        except (ImportError, LookupError):
+            # No time zone database, go by standard time.
+            return datetime.now(timezone(timedelta(hours=-8)))
+
+    def today(self):
+        return self.now().strftime('%Y-%m-%d')
+
+    def seconds_until_reset(self):
+        from datetime import timedelta
+
+        now = self.now()
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        return ((midnight + timedelta(days=1)) - now).total_seconds()
+
+    def load(self):
+        with self.lock:
+            if self.ledger is None:
+                self.ledger = self.load_cache(
+                    self.cache_name, default={'usage': dict(), 'exceeded': None}
+                )
+            return self.ledger
+
+    def save(self):
+        '''
+        Add the units spent since the last save to the saved ledger.
+        '''
+        with self.lock:
+            self.ledger = self.update_cache(self.cache_name, self.merge)
+            self.unsaved.clear()
+
+    def merge(self, ledger):
+        ledger = ledger or {'usage': dict(), 'exceeded': None}
+
+        for (day, endpoint), units in self.unsaved.items():
+            usage = ledger['usage'].setdefault(day, dict())
+            usage[endpoint] = usage.get(endpoint, 0) + units
+
+        if self.ledger is not None:
+            ledger['exceeded'] = max(
+                ledger['exceeded'] or '', self.ledger['exceeded'] or ''
+            ) or None
+
+        for day in sorted(ledger['usage'])[:-self.history_days]:
+            del ledger['usage'][day]
+
+        return ledger
+
+    def usage(self, day):
+        with self.lock:
+            usage = dict(self.load()['usage'].get(day, dict()))
+
+            for (unsaved_day, endpoint), units in self.unsaved.items():
+                if unsaved_day == day:
+                    usage[endpoint] = usage.get(endpoint, 0) + units
+
+            return usage
+
+    def remaining(self, day=None):
+        day = day or self.today()
+
+        if self.load()['exceeded'] == day:
+            return 0
+        return max(0, SETTINGS.DAILY_QUOTA - sum(self.usage(day).values()))
+
+    def rate(self, day=None):
+        '''
+        Requests per second that spread the remaining units over the day.
+        '''
+        active = self.seconds_until_reset() * self.max_duty_cycle
+        return max(self.remaining(day), 1) / max(active, 1)
+
+    def spend(self, endpoint):
+        '''
+        Count a call to `endpoint`, waiting for the rate limit if need be.
+        '''
+        cost = self.costs[endpoint]
+
+        with self.lock:
+            day = self.today()
+
+            if self.remaining(day) < cost:
+                raise QuotaExceeded(
+                    403, f'the daily quota of {SETTINGS.DAILY_QUOTA} units is used up',
+                    reason='quotaExceeded',
+                )
+
+            self.unsaved[(day, endpoint)] += cost
+
+            if sum(self.unsaved.values()) >= self.save_every:
+                self.save()
+
+            YouTubeAPI.bucket.set_rate(self.rate(day))
+
+        wait = YouTubeAPI.bucket.reserve()
+
+        if wait >= 1:
+            status(f'waiting {wait:.0f}s to stay within the API quota...')
+        YouTubeAPI.stopped.wait(wait)
+
+    def exceeded(self):
+        '''
+        The API says the quota is used up, stop asking until it is reset.
+        '''
+        with self.lock:
+            self.load()['exceeded'] = self.today()
+            self.save()
+
+    def warn(self):
+        '''
+        Tell the user, once a day, that cached data is shown instead.
+        '''
+        with self.lock:
+            day = self.today()
+            if self.warned == day:
+                return
+            if getattr(background, 'quiet', False):
+                # See `warn_unwarned()`.
+                self.unwarned = day
+                return
+            self.warned = day
+
+        stderr.write('YouTube API quota used up, showing cached videos '
+                     'until it is reset at midnight Pacific time\n')
+
+    def warn_unwarned(self):
+        '''
+        Give the warning that a background thread could not.
+        '''
+        if self.unwarned == self.today():
+            self.warn()
+
+    def report(self, days=7):
+        day = self.today()
+        usage = self.usage(day)
+        reset = int(self.seconds_until_reset())
+
+        stdout.write(f'{"ENDPOINT":<16} {"UNITS":>8}\n')
+        for endpoint in self.costs:
+            stdout.write(f'{endpoint:<16} {usage.get(endpoint, 0):>8}\n')
+
+        stdout.write(f'\n{sum(usage.values())} of {SETTINGS.DAILY_QUOTA} units '
+                     f'used today, {self.remaining(day)} left, reset in '
+                     f'{reset // 3600}h{reset % 3600 // 60:02}m\n')
+        if self.load()['exceeded'] == day:
+            stdout.write('the API reported the quota as exceeded\n')
+        if self.remaining(day):
+            stdout.write(f'requests limited to {self.rate(day) * 60:.1f} per minute\n')
+
+        history = self.load()['usage']
+        stdout.write(f'\n{"DAY":<16} {"UNITS":>8}\n')
+        for past in sorted(set(history) | {day})[-days:]:
+            stdout.write(f'{past:<16} {sum(self.usage(past).values()):>8}\n')
+
+
+class YouTubeAPI(Cachable, LazyLoaded):
+    '''
+    Methods querying the YouTube API, within the daily quota (see `Quota`).
+    '''
+    # Shared by every request, allowing bursts of `REQUEST_BURST`.
+    bucket = TokenBucket(
+        rate=Settings.DAILY_QUOTA / (24 * 60 * 60 * Quota.max_duty_cycle),
+        capacity=Settings.REQUEST_BURST,
+    )
+
+    # Once set, requests not sent yet raise `Stopped` instead of waiting.
+    stopped = threading.Event()
+
+    # Rate limited requests and server errors are retried after
+    # `retry_delay` seconds, doubled for each retry after the first.
+    max_attempts = 3
+    retry_delay = 1
+
+    def execute(self, query, endpoint):
+        for attempt in range(self.max_attempts):
+            QUOTA.spend(endpoint)
+
+            if self.stopped.is_set():
+                raise Stopped()
+
+            try:
+                with METRICS.timer(f'request {endpoint}'):
+                    return self.request(query)
+            except APIError as error:
+                if error.reason in ('quotaExceeded', 'dailyLimitExceeded'):
+                    QUOTA.exceeded()
+                    raise QuotaExceeded(error.status, error.message, error.reason) from error
+
+                transient = (
+                    error.reason in ('rateLimitExceeded', 'userRateLimitExceeded', 'backendError')
+                    or error.status >= 500
+                )
+                if not transient or attempt + 1 == self.max_attempts:
+                    raise
+
+            self.stopped.wait(self.retry_delay * (2 ** attempt))
+
+    def request(self, query):
+        try:
+            return query.execute()
+        except APIError:
+            raise
+        except Exception as error:
+            # googleapiclient.errors.HttpError
+            status = getattr(getattr(error, 'resp', None), 'status', None)
+            if status is None:
+                raise
+
+            import json
+
+            try:
+                reason = json.loads(error.content)['error']['errors'][0]['reason']
+            except (AttributeError, ValueError, LookupError, TypeError):
+                reason = ''
+            raise APIError(int(status), str(error), reason=reason) from error
+
+
+class ChannelID(YouTubeAPI):
+    '''
+    Get ids of channels.
+
+    Usernames that no channel goes by are remembered as well (with an id
+    of None), and only looked up again when forced to.
+    '''
+    def __init__(self):
+        self.cache_name = 'channel_ids'
+
+    def get(self, username):
+        return self.resolve([username]).get(username)
+
+    def resolve(self, usernames, force=False):
+        '''
+        Return a {username: channel id} dict of `usernames`.
+
+        Unknown usernames are looked up concurrently. Lookups that fail
+        because the quota is used up are left out.
+        '''
+        with METRICS.timer('channel ids'):
+            return self.resolve_all(usernames, force)
+
+    def resolve_all(self, usernames, force):
+        ids, missing = self.cached(usernames, force)
+
+        if missing:
+            status(f'fetching channel ids of {len(missing)} channels...')
+
+            found = dict()
+
+            for username, channel_id in zip(missing, concurrent_map(self.fetch, missing)):
+                if channel_id is not False:
+                    found[username] = channel_id
+
+            ids.update(found)
+            self.remember(found)
+
+        return {username: ids[username] for username in usernames if username in ids}
+
+    def cached(self, usernames, force=False):
+        '''
+        Return the cached {username: channel id} dict, and a list of those
+        `usernames` that need to be looked up.
+        '''
+        ids = self.load_cache(self.cache_name, default=dict())
+
+        missing = [
+            username for username in dict.fromkeys(usernames)
+            if username not in ids or (force and ids[username] is None)
+        ]
+
+        return ids, missing
+
+    def remember(self, found):
+        if found:
+            # Merge with what other processes may have saved meanwhile.
+            self.update_cache(self.cache_name, lambda ids: {**(ids or dict()), **found})
+
+    def fetch(self, username):
+        '''
+        Return the id of the channel of `username`, None if there is no
+        such channel, or False if the quota is used up.
+        '''
+        query = self.lazy().channels().list(
+            part='id',
+            forUsername=username,
+        )
+
+        try:
+            response = self.execute(query, 'channels')
+        except QuotaExceeded:
+            QUOTA.warn()
+            return False
+
+        items = response.get('items') or [None]
+        return items[-1] and items[-1]['id']
+
+
+class ChannelUploads(YouTubeAPI):
+    '''
+    Get uploads from a channel.
+
+    The uploads of each channel are cached together with the time bucket
+    they were fetched in. Once the bucket has passed, the channel is
+    refreshed incrementally: a small page of the newest uploads is
+    requested with the ETag of the previous one, so a channel that
+    posted nothing new answers with an empty "304 Not Modified". Only
+    uploads newer than the newest cached one are merged in.
+
+    Older uploads are read page by page, and only as many as asked for.
+    '''
+    cache_kind = 'uploads'
+    cache_expires = True
+    max_results_per_page = 50
+
+    def __init__(self, username=None, channel_id=None, timestamp=''):
+        self.channel_id = channel_id
+        self.uploads_id = re.sub('^UC', 'UU', self.channel_id)
+        self.username = username
+        self.timestamp = timestamp.ljust(10, "0")
+        self.next_page = None
+
+        self.cache_name = self.channel_id
+
+    def get(self, force=False, limit=None):
+        '''
+        Return up to `limit` of the newest uploads.
+        '''
+        if limit is None:
+            limit = SETTINGS.VIDS_REQUESTED_PER_CHANNEL
+
+        state = self.load_cache(self.cache_name, default=None)
+        stale = state is None or state['timestamp'] != self.timestamp or force
+
+        if not stale and (len(state['items']) >= limit or state['complete']):
+            return state['items'][:limit]
+
+        status(f'fetching videos from "{self.username}"...')
+
+        if state is None:
+            state = {'items': [], 'etag': None, 'next_page': None, 'complete': False}
+            stale = False
+
+        try:
+            if stale:
+                state = self.fetch_new(state, limit)
+
+            if len(state['items']) < limit and not state['complete']:
+                state = self.fetch_more(state, limit)
+        except QuotaExceeded:
+            # Keep the timestamp, so the channel is fetched once the quota
+            # is reset.
+            QUOTA.warn()
+            return state['items'][:limit]
+
+        state['timestamp'] = self.timestamp
+        self.save_cache(self.cache_name, data=state)
+
+        return state['items'][:limit]
+
+    def fetch(self, max_results, page_token=None, etag=None):
+        query = self.lazy().playlistItems().list(
+            part='contentDetails, snippet',
+            playlistId=self.uploads_id,
+            maxResults=max_results,
+            pageToken=page_token,
+        )
+
+        if etag is not None:
+            query.headers['If-None-Match'] = etag
+
+        try:
+            return self.execute(query, 'playlistItems')
+        except APIError as error:
+            if error.status == 304:
+                return None
+            raise
+
+    def stream(self, limit, page_token=None):
+        '''
+        Yield up to `limit` uploads, newest first, one page at a time.
+
+        Afterwards `self.next_page` holds the token of the page after the
+        last one read, or None if the end of the playlist was reached.
+        '''
+        count = 0
+        self.next_page = page_token
+
+        while count < limit:
+            response = self.fetch(
+                min(self.max_results_per_page, limit - count),
+                page_token=page_token,
+            )
+
+            self.next_page = page_token = response.get('nextPageToken')
+
+            for item in response['items']:
+                count += 1
+                yield item
+
+            if page_token is None:
+                return
+
+    def fetch_more(self, state, limit):
+        '''
+        Extend the cached uploads to `limit` items.
+        '''
+        items = list(state['items'])
+        known_ids = {video_id(item) for item in items}
+
+        def add(uploads):
+            for item in uploads:
+                if video_id(item) not in known_ids:
+                    known_ids.add(video_id(item))
+                    items.append(item)
+
+        if state['next_page'] is None:
+            # Read from the top, skipping what is cached already.
+            add(self.stream(limit))
+        else:
+            # Uploads added to the top since the page token was saved push
+            # uploads we have onto its page, so read on until we have enough.
+            self.next_page = state['next_page']
+
+            while len(items) < limit and self.next_page is not None:
+                add(self.stream(limit - len(items), page_token=self.next_page))
+
+        return dict(
+            state,
+            items=items,
+            next_page=self.next_page,
+            complete=self.next_page is None,
+        )
+
+    def fetch_new(self, state, limit):
+        '''
+        Add uploads newer than the newest cached one.
+        '''
+        response = self.fetch(SETTINGS.INCREMENTAL_PAGE_SIZE, etag=state['etag'])
+
+        if response is None:
+            return state
+
+        known_ids = {video_id(item) for item in state['items']}
+        newest = max(
+            (item['snippet']['publishedAt'] for item in state['items']),
+            default='',
+        )
+
+        self.next_page = response.get('nextPageToken')
+
+        def uploads():
+            yield from response['items']
+            if self.next_page is not None:
+                yield from self.stream(
+                    limit - len(response['items']), page_token=self.next_page
+                )
+
+        new_items = []
+
+        for item in uploads():
+            if video_id(item) in known_ids:
+                break
+            if item['snippet']['publishedAt'] < newest:
+                break
+
+            new_items.append(item)
+        else:
+            # Nothing we know of within `limit` uploads, start over.
+            return {
+                'items': new_items,
+                'etag': response.get('etag'),
+                'next_page': self.next_page,
+                'complete': self.next_page is None,
+            }
+
+        items = new_items + state['items']
+        max_items = max(limit, SETTINGS.VIDS_REQUESTED_PER_CHANNEL)
+
+        if len(items) > max_items:
+            return {
+                'items': items[:max_items],
+                'etag': response.get('etag'),
+                'next_page': None,
+                'complete': False,
+            }
+
+        return dict(state, items=items, etag=response.get('etag'))
+
+
+class VideoDescriptions(Cachable):
+    '''
+    Video descriptions, cached apart from the other details since they are
+    rarely needed.
+    '''
+    cache_kind = 'descriptions'
+    cache_expires = True
+
+    def get(self, video_ids):
+        return self.load_many(video_ids)
+
+
+class VideoDetails(YouTubeAPI):
+    '''
+    Get information about one or more videos.
+
+    A list of ids is looked up in batches of `max_ids_per_request`, the
+    most the API accepts in a single request.
+
+    Only the statistics ytls uses are cached (see `project()`); the
+    description goes to `VideoDescriptions`.
+    '''
+    cache_kind = 'details'
+    cache_expires = True
+    max_ids_per_request = 50
+
+    def __init__(self, video_id=None, timestamp=''):
+        if isinstance(video_id, list):
+            self.video_ids = video_id
+        else:
+            self.video_ids = [video_id]
+
+        self.timestamp = timestamp.ljust(10, "0")
+
+    def cache_name(self, video_id):
+        return f'{video_id}.{self.timestamp}'
+
+    def uncached(self):
+        '''
+        Return the ids of the videos with no cached details.
+        '''
+        names = {self.cache_name(v): v for v in self.video_ids}
+        return [names[name] for name in self.store.missing(self.cache_kind, names)]
+
+    @staticmethod
+    def project(item, fetched):
+        statistics = item.get('statistics', dict())
+
+        return {
+            'comments': int(statistics.get('commentCount', 0)),
+            'dislikes': int(statistics.get('dislikeCount', 0)),
+            'likes': int(statistics.get('likeCount', 0)),
+            'views': int(statistics.get('viewCount', 0)),
+            'fetched': fetched,
+        }
+
+    def cached(self):
+        '''
+        Return a dict mapping each cached video id to its details.
+        '''
+        details = dict()
+        fetched = dict()
+        descriptions = dict()
+
+        cached = self.load_many(self.cache_name(v) for v in self.video_ids)
+
+        for video_id in self.video_ids:
+            stats = cached.get(self.cache_name(video_id))
+
+            # Entries written by older versions hold the raw response.
+            if isinstance(stats, list) and stats:
+                descriptions[video_id] = stats[0]['snippet'].get('description')
+                stats = fetched[self.cache_name(video_id)] = self.project(stats[0], 0)
+
+            if stats:
+                details[video_id] = stats
+
+        self.save_many(fetched)
+        VideoDescriptions().save_many(descriptions)
+
+        return details
+
+    def get(self, force=False):
+        '''
+        Return a dict mapping each video id to its details.
+        '''
+        details = dict() if force else self.cached()
+        fetched = dict()
+        descriptions = dict()
+
+        missing = [v for v in self.video_ids if v not in details]
+
+        batches = [
+            missing[start:start + self.max_ids_per_request]
+            for start in range(0, len(missing), self.max_ids_per_request)
+        ]
+
+        now = time()
+
+        for batch, response in zip(batches, concurrent_map(self.fetch, batches)):
+            if response is None:
+                continue
+
+            for item in response['items']:
+                stats = details[item['id']] = self.project(item, now)
+                fetched[self.cache_name(item['id'])] = stats
+                descriptions[item['id']] = item['snippet'].get('description')
+
+            # Private or deleted videos are left out of the response. Cache
+            # them as having no statistics, so they are not asked for again
+            # until they are refreshed like any other.
+            for video_id in batch:
+                if video_id not in details:
+                    stats = details[video_id] = self.project(dict(), now)
+                    fetched[self.cache_name(video_id)] = stats
+
+        self.save_many(fetched)
+        VideoDescriptions().save_many(descriptions)
+
+        return details
+
+    def fetch(self, video_ids):
+        query = self.lazy().videos().list(
+            part='statistics, snippet',
+            id=','.join(video_ids),
+        )
+
+        try:
+            return self.execute(query, 'videos')
+        except QuotaExceeded:
+            QUOTA.warn()
+            return None
+
+
+class Video:
+    '''
+    A compact record of what ytls displays, sorts and searches by.
+
+    The description is read from the cache each time it is used.
+    '''
+    __slots__ = (
+        'id', 'channel', 'title', 'pubdate', 'pubtime', 'viewed',
+        'comments', 'dislikes', 'likes', 'views',
+    )
+
+    def __init__(self, video, details=None):
+        self.id = video['resourceId']['videoId']
+        self.channel = intern(video['channelTitle'])
+        self.title = video["title"]
+        self.pubdate = video['publishedAt'][2:10]
+        self.pubtime = video['publishedAt'][11:16]
+        self.viewed = self.id in VIEWS
+
+        if details is None:
+            status(f'fetching details of video "{self.title}"...')
+            details = VideoDetails(video_id=self.id).get(force=False).get(self.id)
+
+        self.update(details)
+
+    def update(self, details):
+        # Private or deleted videos are missing from `videos().list`.
+        details = details or dict()
+
+        self.comments = details.get('comments', 0)
+        self.dislikes = details.get('dislikes', 0)
+        self.likes = details.get('likes', 0)
+        self.views = details.get('views', 0)
+
+    @property
+    def url(self):
+        return f'https://youtube.com/watch?v={self.id}'
+
+    @property
+    def description(self):
+        return VideoDescriptions().get([self.id]).get(self.id)
+
+    @staticmethod
+    def descriptions(videos):
+        '''
+        Return the descriptions of `videos`, looked up all at once.
+        '''
+        return VideoDescriptions().get(video.id for video in videos)
+
+
+class Snapshot(Cachable):
+    '''
+    The last video list, saved to a single file to restore it at startup
+    without going through the cache.
+
+    The file holds a header, the length of each section, then the
+    sections: the video's text fields, column by column, and its
+    statistics, as arrays of numbers. A text column is stored as one
+    UTF-8 string with an array of the offsets where each field starts.
+    Channel names are stored once, and referred to by index.
+
+    Snapshots of another `version` are ignored.
+    '''
+    magic = b'YTLS'
+    version = 1
+    header = '<4sHId'
+    texts = ('id', 'title', 'pubdate', 'pubtime')
+    numbers = ('comments', 'dislikes', 'likes', 'views')
+
+    def __init__(self):
+        self.path = os.path.join(self.cache_base, 'videos.snapshot')
+
+    @staticmethod
+    def pack_texts(texts):
+        from array import array
+
+        offsets = array('I', [0])
+
+        for text in texts:
+            offsets.append(offsets[-1] + len(text))
+
+        return [offsets.tobytes(), ''.join(texts).encode()]
+
+    @staticmethod
+    def unpack_texts(offsets, blob):
+        from array import array
+
+        offsets = array('I', offsets)
+        text = blob.decode()
+
+        return [text[start:end] for start, end in zip(offsets, offsets[1:])]
+
+    def save(self, videos):
+        import struct
+        from array import array
+
+        channels = list(dict.fromkeys(video.channel for video in videos))
+        channel_index = {channel: index for index, channel in enumerate(channels)}
+
+        sections = []
+
+        for field in self.texts:
+            sections += self.pack_texts([getattr(video, field) for video in videos])
+
+        sections += self.pack_texts(channels)
+        sections.append(array('I', [channel_index[video.channel] for video in videos]).tobytes())
+
+        for field in self.numbers:
+            sections.append(array('Q', [getattr(video, field) for video in videos]).tobytes())
+
+        os.makedirs(self.cache_base, exist_ok=True)
+        new_snapshot = f'{self.path}.{os.getpid()}'
+
+        with open(new_snapshot, 'wb') as snapshot:
+            snapshot.write(struct.pack(self.header, self.magic, self.version, len(videos), time()))
+            snapshot.write(struct.pack(f'<{len(sections)}Q', *map(len, sections)))
+            snapshot.write(b''.join(sections))
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+
+        # Other processes read either the old snapshot, or the new one, and
+        # so does this one after a crash.
+        os.replace(new_snapshot, self.path)
+
+    def load(self):
+        '''
+        Return the saved videos, and when they were saved, or ([], None)
+        if there is no snapshot, or it is damaged.
+        '''
+        import mmap
+        import struct
+
+        try:
+            with open(self.path, 'rb') as snapshot:
+                data = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return [], None
+
+        with data:
+            try:
+                return self.unpack(data)
+            except (struct.error, ValueError, UnicodeDecodeError, IndexError):
+                return [], None
+
+    def unpack(self, data):
+        import struct
+        from array import array
+
+        magic, version, count, saved = struct.unpack_from(self.header, data)
+
+        if (magic, version) != (self.magic, self.version):
+            return [], None
+
+        # Text columns, channel names, channel indices, numbers.
+        num_sections = (2 * len(self.texts)) + 3 + len(self.numbers)
+        offset = struct.calcsize(self.header)
+        lengths = struct.unpack_from(f'<{num_sections}Q', data, offset)
+        offset += 8 * num_sections
+
+        if offset + sum(lengths) != len(data):
+            raise ValueError('truncated snapshot')
+
+        sections = []
+
+        for length in lengths:
+            sections.append(data[offset:offset + length])
+            offset += length
+
+        texts = [
+            self.unpack_texts(*sections[start:start + 2])
+            for start in range(0, 2 * len(self.texts), 2)
+        ]
+        sections = sections[2 * len(self.texts):]
+
+        channels = [intern(channel) for channel in self.unpack_texts(*sections[:2])]
+        channel_column = [channels[index] for index in array('I', sections[2])]
+        numbers = [array('Q', section) for section in sections[3:]]
+
+        if any(len(column) != count for column in [*texts, channel_column, *numbers]):
+            raise ValueError('inconsistent snapshot')
+
+        videos = []
+        views = VIEWS.get()
+
+        for id_, title, pubdate, pubtime, channel, *stats in zip(
+            *texts, channel_column, *numbers
+        ):
+            video = Video.__new__(Video)
+            video.id = id_
+            video.title = title
+            video.pubdate = pubdate
+            video.pubtime = pubtime
+            video.channel = channel
+            video.comments, video.dislikes, video.likes, video.views = stats
+            video.viewed = id_ in views
+            videos.append(video)
+
+        return videos, saved
+
+
+class Actions:
+    '''
+    Doing stuff to video objects.
+    '''
+    def __init__(self, video):
+        self.video = video
+
+    def message(self, _action):
+        stdout.write(' '.join([
+            f'{_action}:',
+            colored(
+                viewed=False,
+                color_key="channel",
+                string=f'{self.video.channel}:',
+            ),
+            f'{self.video.title}\n',
+        ]))
+
+    def download(self):
+        if which('youtube-dl'):
+            DOWNLOADS.add(self.video)
+            self.message('queued download')
+
+    def rip_audio(self, audio_format):
+        if which('youtube-dl'):
+            audio_formats = ['aac', 'flac', 'mp3', 'm4a', 'opus', 'vorbis', 'wav']
+
+            if audio_format not in audio_formats:
+                audio_format = 'mp3'
+
+            DOWNLOADS.add(self.video, audio_format=audio_format)
+            self.message(f'queued {audio_format} rip')
+
+    def open_in_browser(self):
+        self.open_all_in_browser([self.video])
+
+    @staticmethod
+    def open_all_in_browser(videos):
+        '''
+        Open `videos` in new tabs with a single $BROWSER command, which
+        starts the browser if it is not running yet, then mark them all as
+        watched.
+        '''
+        if not videos:
+            return
+
+        if os.name != 'posix':
+            stderr.write(f'not yet implemented for os type: {os.name}\n')
+            return
+
+        if not which(BROWSER):
+            stderr.write(f'browser not found: {BROWSER}\n')
+            return
+
+        import subprocess
+
+        if os.path.basename(BROWSER) == 'firefox':
+            argv = [BROWSER]
+            for video in videos:
+                argv += ['-new-tab', video.url]
+        else:
+            argv = [BROWSER, *(video.url for video in videos)]
+
+        for video in videos:
+            Actions(video).message('opening')
+
+        browser = subprocess.Popen(
+            argv,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+
+        # If the browser was running already, this only hands it the urls
+        # and exits.
+        threading.Thread(target=browser.wait, daemon=True).start()
+
+        Actions.mark_all_as_watched(videos)
+
+    def open_in_mpv(self):
+        os.system('youtube-mpv {}' % shellescape(self.video.url))
+
+    def mark_as_watched(self):
+        self.mark_all_as_watched([self.video])
+
+    @staticmethod
+    def mark_all_as_watched(videos):
+        '''
+        Mark `videos` as watched, with a single write to the view history.
+        '''
+        VIEWS.add_many(video.id for video in videos)
+
+        for video in videos:
+            video.viewed = True
+            Actions(video).message('marked as watched')
+
+
+@lru_cache(maxsize=64)
+def compile_search(search_string):
+    return re.compile(search_string, flags=re.IGNORECASE)
+
+
+class SearchIndex:
+    '''
+    Trigram index over the text of every video searched so far.
+
+    A pattern that is plain text, or an alternation of plain texts, is
+    only checked against the videos containing every trigram of one of
+    its alternatives. Any other pattern is checked against every video.
+    Fields are indexed the first time they are searched.
+    '''
+    fields = ('title', 'channel', 'description')
+    special = re.compile(r'[.^$*+?{}\[\]\\|()]')
+
+    def __init__(self):
+        self.trigrams = {field: defaultdict(set) for field in self.fields}
+        self.indexed = {field: set() for field in self.fields}
+
+    @staticmethod
+    def texts(videos, field):
+        '''
+        Return (video, text of `field`) pairs.
+        '''
+        if field == 'description':
+            descriptions = Video.descriptions(videos)
+            return [(video, descriptions.get(video.id) or '') for video in videos]
+
+        return [(video, getattr(video, field) or '') for video in videos]
+
+    def update(self, videos, fields):
+        for field in fields:
+            trigrams = self.trigrams[field]
+            indexed = self.indexed[field]
+
+            new_videos = [video for video in videos if video.id not in indexed]
+
+            for video, text in self.texts(new_videos, field):
+                indexed.add(video.id)
+
+                text = text.lower()
+                for i in range(len(text) - 2):
+                    trigrams[text[i:i + 3]].add(video.id)
+
+    def alternatives(self, search_string):
+        if search_string.startswith('(') and search_string.endswith(')'):
+            search_string = search_string[1:-1]
+
+        alternatives = search_string.split('|')
+
+        for alternative in alternatives:
+            if len(alternative) < 3 or self.special.search(alternative):
+                return None
+
+        return alternatives
+
+    def candidates(self, search_string, fields):
+        '''
+        Return the ids of the videos that may match, or None if the index
+        can't tell.
+        '''
+        alternatives = self.alternatives(search_string)
+
+        if alternatives is None:
+            return None
+
+        candidates = set()
+
+        for alternative in alternatives:
+            text = alternative.lower()
+            trigrams = {text[i:i + 3] for i in range(len(text) - 2)}
+
+            for field in fields:
+                matches = sorted(
+                    (self.trigrams[field].get(t, set()) for t in trigrams), key=len
+                )
+                candidates.update(matches[0].intersection(*matches[1:]))
+
+        return candidates
+
+    def search(self, videos, pattern, fields=('title',)):
+        '''
+        Return the ids of `videos` where `pattern` matches one of `fields`.
+        '''
+        self.update(videos, fields)
+        candidates = self.candidates(pattern.pattern, fields)
+
+        if candidates is not None:
+            videos = [video for video in videos if video.id in candidates]
+
+        return {
+            video.id
+            for field in fields
+            for video, text in self.texts(videos, field)
+            if pattern.search(text)
+        }
+
+
+class Renderer:
+    '''
+    Format and print the video listing.
+
+    Rows are cached per video for each combination of terminal width,
+    index column width, url display and watched state. A listing is
+    written to the terminal with a single write.
+    '''
+    unprintable = re.compile(f'[^{re.escape(string.printable)}]')
+    highlight = '\033[31;1m{}\033[0m'
+    max_cached_rows = 100000
+
+    def __init__(self):
+        self.rows = dict()
+        self.titles = dict()
+
+    def title(self, video):
+        try:
+            return self.titles[video.id]
+        except KeyError:
+            title = self.titles[video.id] = self.unprintable.sub('_', video.title)
+            return title
+
+    def row(self, video, width, index_width, pattern=None):
+        '''
+        Return the row for `video`, without its index column, or None if
+        the terminal is too narrow to show it.
+        '''
+        key = (video.id, width, index_width, SETTINGS.SHOW_URL, video.viewed)
+
+        if pattern is None and key in self.rows:
+            return self.rows[key]
+
+        title = self.title(video)
+
+        max_title_len = (width - ((index_width + 1)
+                                  + ((len(video.pubdate) + 1))
+                                  + ((len(video.pubtime) + 1))
+                                  + ((len(video.channel) + 2))
+                                  + ((len(video.url) * SETTINGS.SHOW_URL) + 2)
+                                  ))
+
+        if max_title_len < 6:
+            return None
+        elif (len(title) > max_title_len):
+            title = f' {title[:(max_title_len)]}… '
+        else:
+            title = f' {title}' + (' ' * (max_title_len - (len(title) - 1))) + ' '
+
+        if pattern is not None:
+            match = pattern.search(title)
+            if match:
+                title = ''.join((
+                    title[:match.start()],
+                    self.highlight.format(match.group(0)),
+                    title[match.end():],
+                ))
+
+        row = ''.join((
+            colored(video.viewed, 'timestamp', f'{video.pubdate} {video.pubtime}'),
+            colored(video.viewed, 'channel', f' {video.channel}:'),
+            colored(video.viewed, 'text', title),
+            colored(video.viewed, 'url', f'{video.url}\n') if SETTINGS.SHOW_URL else '\n',
+        ))
+
+        if pattern is None:
+            if len(self.rows) >= self.max_cached_rows:
+                self.rows.clear()
+            self.rows[key] = row
+
+        return row
+
+    def list(self, videos, width, search_string=None, fields=('title',)):
+        with METRICS.timer('render'):
+            self.render(videos, width, search_string, fields)
+
+    def render(self, videos, width, search_string, fields):
+        index_width = len(str(len(videos)))
+        pattern = None
+
+        if search_string is not None:
+            pattern = compile_search(search_string)
+            matches = SEARCH_INDEX.search(videos, pattern, fields)
+
+        lines = []
+
+        for index, video in enumerate(videos):
+            if video.viewed and SETTINGS.HIDE:
+                continue
+
+            if pattern is not None and video.id not in matches:
+                continue
+
+            row = self.row(video, width, index_width, pattern)
+
+            if row is None:
+                lines.append('screen not wide enough\n')
+                continue
+
+            lines.append(colored(video.viewed, 'index', f'{str(index).ljust(index_width)} '))
+            lines.append(row)
+
+        debug(f'cols={width}, rows={len(videos)}')
+
+        stdout.write(''.join(lines))
+        stdout.flush()
+
+
+class LiveListing:
+    '''
+    Show the newest videos of a fetch in progress, in the order of the
+    `date` sort, above a line telling how far the fetch got.
+
+    Videos are inserted into the sorted list as they come in. The bottom
+    of the list, as much as fits on the screen, is redrawn in place at
+    most every `redraw_interval` seconds.
+    '''
+    redraw_interval = 0.1
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.keys = []
+        self.videos = []
+        self.progress = ''
+        self.drawn = 0
+        self.drawn_at = 0
+
+    def add(self, videos, subscription):
+        for position, video in enumerate(videos):
+            # Videos published at the same time are in subscriptions.conf
+            # order, whichever channel came in first.
+            key = (video.pubdate, video.pubtime, subscription, position)
+            index = bisect_right(self.keys, key)
+            self.keys.insert(index, key)
+            self.videos.insert(index, video)
+
+    def update(self, progress):
+        self.progress = progress
+
+        if monotonic() - self.drawn_at >= self.redraw_interval:
+            self.draw()
+
+    def draw(self):
+        index_width = len(str(len(self.videos)))
+        rows = []
+
+        for index in range(len(self.videos) - 1, -1, -1):
+            if len(rows) >= self.height - 2:
+                break
+
+            video = self.videos[index]
+
+            if video.viewed and SETTINGS.HIDE:
+                continue
+
+            row = RENDERER.row(video, self.width, index_width)
+
+            if row is not None:
+                rows.append(colored(video.viewed, 'index', f'{str(index).ljust(index_width)} ') + row)
+
+        stdout.write(''.join((self.erase(), *reversed(rows), f'{self.progress}\n')))
+        stdout.flush()
+
+        self.drawn = len(rows) + 1
+        self.drawn_at = monotonic()
+
+    def erase(self):
+        '''
+        Return the escape codes clearing what was drawn last.
+        '''
+        return f'\033[{self.drawn}F\033[J' if self.drawn else ''
+
+    def clear(self):
+        stdout.write(self.erase())
+        stdout.flush()
+        self.drawn = 0
+
+
+class Sorted:
+    '''
+    Chainable sort operations for Video objects
+
+    Each `by_*` property adds a sort key; earlier keys take precedence.
+    `reverse` flips the direction of the key added last, or reverses the
+    videos if there is none yet. Chaining never modifies the Sorted it
+    was called on.
+
+    the `.get()` method breaks the chain and executes the (stable) sort.
+    '''
+    def __init__(self, videos=(), keychain=()):
+        self.videos = videos
+        self.keychain = tuple(keychain)
+
+    def __repr__(self):
+        return f'Sorted(videos={self.videos}, keychain={self.keychain})'
+
+    def get(self):
+        with METRICS.timer('sort'):
+            return self.sorted()
+
+    def sorted(self):
+        videos = list(self.videos)
+
+        # Sort by the least significant keys first, relying on stability.
+        # Consecutive keys in the same direction are sorted in one pass,
+        # as a tuple.
+        passes = []
+
+        for attribute, reverse in self.keychain:
+            if passes and passes[-1][1] == reverse:
+                passes[-1][0].append(attribute)
+            else:
+                passes.append(([attribute], reverse))
+
+        for attributes, reverse in reversed(passes):
+            videos.sort(key=attrgetter(*attributes), reverse=reverse)
+
+        return videos
+
+    def where(self, condition: callable):
+        return Sorted(
+            videos=list(filter(condition, self.videos)),
+            keychain=self.keychain,
+        )
+
+    def by(self, attribute):
+        return Sorted(
+            videos=self.videos,
+            keychain=self.keychain + ((attribute, False),),
+        )
+
+    @property
+    def reverse(self):
+        if not self.keychain:
+            return Sorted(videos=list(reversed(self.videos)))
+
+        *keychain, (attribute, reverse) = self.keychain
+        return Sorted(
+            videos=self.videos,
+            keychain=(*keychain, (attribute, not reverse)),
+        )
+
+    @property
+    def by_date(self):
+        return self.by('pubdate')
+
+    @property
+    def by_time(self):
+        return self.by('pubtime')
+
+    @property
+    def by_user(self):
+        return self.by('channel')
+
+    @property
+    def by_comments(self):
+        return self.by('comments')
+
+    @property
+    def by_likes(self):
+        return self.by('likes')
+
+    @property
+    def by_views(self):
+        return self.by('views')
+
+
+class ViewHistory(Cachable):
+    '''
+    Keep track of which videos have been viewed, in a journal of ids that
+    is compacted into a snapshot in the cache store once it grows too big.
+    '''
+    valid_id = re.compile(r'^[A-Za-z0-9_-]{11}$')
+
+    def __init__(self):
+        self.cache_name = 'view_history'
+        self.journal_path = os.path.join(self.cache_base, 'view_history.log')
+        self.lock_path = os.path.join(self.cache_base, 'view_history.lock')
+        self.views = None
+        self.snapshot_written = None
+        self.journal_inode = None
+        self.journal_offset = 0
+        self.journal_torn = False
+
+    def __contains__(self, video_id):
+        # Only what is in memory, see `get()`.
+        views = self.get() if self.views is None else self.views
+        return video_id in views
+
+    def add(self, video_id):
+        self.add_many([video_id])
+
+    def add_many(self, video_ids):
+        views = self.get()
+        new_views = [v for v in dict.fromkeys(video_ids) if v not in views]
+
+        if not new_views:
+            return
+
+        record = ''.join(f'{video_id}\n' for video_id in new_views)
+
+        # Keep our first id off the end of a previously torn line.
+        if self.journal_torn:
+            record = f'\n{record}'
+
+        # Processes append under a shared lock, and compact under an
+        # exclusive one.
+        with FileLock(self.lock_path, shared=True):
+            journal = os.open(
+                self.journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644
+            )
+            try:
+                os.write(journal, record.encode())
+                os.fsync(journal)
+                journal_size = os.fstat(journal).st_size
+            finally:
+                os.close(journal)
+
+        views.update(new_views)
+
+        if journal_size > SETTINGS.VIEW_JOURNAL_MAX_BYTES:
+            self.compact()
+
+    def compact(self):
+        '''
+        Save the whole history as a snapshot, then start a new journal.
+        '''
+        with FileLock(self.lock_path):
+            # Another process may have compacted it in the meantime.
+            if os.path.getsize(self.journal_path) <= SETTINGS.VIEW_JOURNAL_MAX_BYTES:
+                return
+
+            views = self.get()
+            self.update_cache(self.cache_name, lambda snapshot: (snapshot or set()) | views)
+
+            empty_journal = f'{self.journal_path}.new'
+            open(empty_journal, 'wb').close()
+            os.replace(empty_journal, self.journal_path)
+
+    def get(self):
+        '''
+        Read the journal lines written since the last call, and the snapshot
+        if it was compacted since.
+        '''
+        snapshot_written = self.store.written(self.cache_kind, self.cache_name)
+
+        try:
+            journal = os.stat(self.journal_path)
+            journal_inode, journal_size = journal.st_ino, journal.st_size
+        except FileNotFoundError:
+            journal_inode, journal_size = None, 0
+
+        if (self.views is None
+                or snapshot_written != self.snapshot_written
+                or journal_inode != self.journal_inode
+                or journal_size < self.journal_offset):
+            self.views = self.load_cache(self.cache_name, default=set())
+            self.snapshot_written = snapshot_written
+            self.journal_inode = journal_inode
+            self.journal_offset = 0
+            self.journal_torn = False
+
+        if journal_size > self.journal_offset:
+            self.read_journal()
+
+        return self.views
+
+    def read_journal(self):
+        with open(self.journal_path, 'rb') as journal:
+            journal.seek(self.journal_offset)
+            data = journal.read()
+
+        # An unterminated last line is either still being written or torn;
+        # leave it for the next read.
+        lines, _, tail = data.rpartition(b'\n')
+        self.journal_offset += len(data) - len(tail)
+        self.journal_torn = bool(tail)
+
+        for line in lines.decode('ascii', errors='replace').split('\n'):
+            if self.valid_id.match(line):
+                self.views.add(line)
+
+
+class Downloads(Cachable):
+    '''
+    A queue of youtube-dl jobs shared by every ytls process, and saved on
+    every change. Each process runs the jobs it owns in background threads.
+    '''
+    max_attempts = 3
+
+    # Seconds before a failed job is first retried, doubled each time.
+    retry_delay = 10
+    progress = re.compile(r'^\[download\]\s+([0-9.]+%)')
+
+    def __init__(self):
+        self.cache_name = 'downloads'
+
+        # The jobs this process queued, or took over after their owner
+        # exited, merged into the saved queue.
+        self.jobs = None
+        self.workers = []
+        self.changed = threading.Condition()
+
+    def load(self):
+        with self.changed:
+            if self.jobs is None:
+                self.jobs = dict()
+                self.update_cache(self.cache_name, self.adopt)
+
+            return self.jobs
+
+    @staticmethod
+    def alive(pid):
+        if pid is None:
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def adopt(self, queue):
+        '''
+        Take over the unfinished jobs of processes that have exited.
+        '''
+        queue = queue or dict()
+
+        for job_id, job in queue.items():
+            if job['status'] in ('queued', 'running') and not self.alive(job.get('owner')):
+                job['owner'] = os.getpid()
+                job['status'] = 'queued'
+                self.jobs[job_id] = job
+
+        return queue
+
+    def save(self, forget=()):
+        '''
+        Merge the jobs of this process into the saved queue, and remove the
+        jobs with ids in `forget`.
+        '''
+        def merge(queue):
+            queue = {**(queue or dict()), **self.jobs}
+            for job_id in forget:
+                queue.pop(job_id, None)
+            return queue
+
+        return self.update_cache(self.cache_name, merge)
+
+    def start(self):
+        '''
+        Start the workers, if there is anything for them to do.
+        '''
+        jobs = self.load()
+
+        with self.changed:
+            if self.workers or not any(j['status'] == 'queued' for j in jobs.values()):
+                return
+
+            for _ in range(SETTINGS.DOWNLOAD_WORKERS):
+                worker = threading.Thread(target=self.work, daemon=True)
+                worker.start()
+                self.workers.append(worker)
+
+    def add(self, video, audio_format=None):
+        jobs = self.load()
+
+        def enqueue(queue):
+            queue = queue or dict()
+            job_id = max([*queue, *jobs], default=0) + 1
+            jobs[job_id] = queue[job_id] = {
+                'id': job_id,
+                'owner': os.getpid(),
+                'url': video.url,
+                'channel': video.channel,
+                'title': video.title,
+                'audio_format': audio_format,
+                'status': 'queued',
+                'attempts': 0,
+                'not_before': 0,
+                'progress': '',
+                'error': '',
+            }
+            return queue
+
+        with self.changed:
+            self.update_cache(self.cache_name, enqueue)
+            self.changed.notify()
+
+        self.start()
+
+    def clear(self):
+        '''
+        Forget finished and failed jobs, of every process.
+        '''
+        jobs = self.load()
+
+        with self.changed:
+            queue = {**self.load_cache(self.cache_name, default=dict()), **jobs}
+            finished = [j for j in queue if queue[j]['status'] in ('done', 'failed')]
+
+            for job_id in finished:
+                jobs.pop(job_id, None)
+            self.save(forget=finished)
+
+    def next_job(self):
+        with self.changed:
+            while True:
+                now = time()
+                queued = [j for j in self.jobs.values() if j['status'] == 'queued']
+                ready = [j for j in queued if j['not_before'] <= now]
+
+                if ready:
+                    job = min(ready, key=itemgetter('id'))
+                    job['status'] = 'running'
+                    job['attempts'] += 1
+                    self.save()
+                    return job
+
+                timeout = min((j['not_before'] - now for j in queued), default=None)
+                self.changed.wait(timeout)
+
+    def work(self):
+        while True:
+            job = self.next_job()
+            error = self.run(job)
+
+            with self.changed:
+                if error is None:
+                    job['status'] = 'done'
+                elif job['attempts'] < self.max_attempts:
+                    job['status'] = 'queued'
+                    job['not_before'] = time() + (self.retry_delay * (2 ** (job['attempts'] - 1)))
+                else:
+                    job['status'] = 'failed'
+
+                job['error'] = error or ''
+                self.save()
+                self.changed.notify_all()
+
+    def run(self, job):
+        '''
+        Run youtube-dl for `job`, and return None or an error message.
+        '''
+        import subprocess
+
+        argv = ['youtube-dl', '--newline']
+
+        if job['audio_format'] is not None:
+            argv += ['--extract-audio', '--audio-format', job['audio_format']]
+
+        argv += ['--', job['url']]
+        output = ''
+
+        try:
+            process = subprocess.Popen(
+                argv,
+                cwd=XDG_DOWNLOADS_DIR,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                errors='replace',
+            )
+        except OSError as error:
+            return str(error)
+
+        for line in process.stdout:
+            progress = self.progress.match(line)
+            if progress:
+                job['progress'] = progress.group(1)
+            elif line.strip():
+                output = line.strip()
+
+        if process.wait() != 0:
+            return output or f'youtube-dl exited with status {process.returncode}'
+
+        return None
+
+    def list(self):
+        '''
+        Show the jobs of every process.
+        '''
+        jobs = self.load()
+
+        with self.changed:
+            jobs = {**self.load_cache(self.cache_name, default=dict()), **jobs}
+            jobs = dict(sorted(jobs.items()))
+
+            for job in jobs.values():
+                kind = job['audio_format'] or 'video'
+                status = job['status']
+
+                if status == 'running':
+                    status = f'{status} {job["progress"]}'
+                elif status == 'queued' and job['attempts']:
+                    status = f'retry {job["attempts"] + 1}/{self.max_attempts}'
+
+                stdout.write(' '.join([
+                    str(job['id']).ljust(len(str(max(jobs)))),
+                    status.ljust(14),
+                    kind.ljust(6),
+                    colored(viewed=False, color_key='channel', string=f'{job["channel"]}:'),
+                    f'{job["title"]}\n',
+                ]))
+
+                if job['status'] == 'failed':
+                    stdout.write(f'    {job["error"]}\n')
+
+
+class Daemon(Cachable):
+    '''
+    Keep the cache warm between sessions. REPLs ask it to "refresh" over a
+    unix socket, and get "ok" once it is done.
+    '''
+    # Seconds between checks for subscriptions whose time bucket passed.
+    poll_interval = 60
+
+    # A worker thread refreshes; the main thread checks this often for
+    # SIGTERM or ^C, then stops the refresh's requests not sent yet.
+    stop_interval = 0.5
+    request_timeout = 10 * 60
+
+    def __init__(self):
+        self.socket_path = os.path.join(self.cache_base, 'daemon.sock')
+        self.requested = 0
+        self.completed = 0
+        self.changed = threading.Condition()
+        self.stopping = False
+
+    def request(self, command):
+        '''
+        Send `command` to the daemon and return its answer, or None if no
+        daemon is running.
+        '''
+        import socket
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.settimeout(self.request_timeout)
+            try:
+                connection.connect(self.socket_path)
+                connection.sendall(f'{command}\n'.encode())
+                return connection.makefile().readline().strip()
+            except OSError:
+                return None
+
+    def serve(self, server):
+        while True:
+            connection, _ = server.accept()
+            threading.Thread(target=self.answer, args=(connection,), daemon=True).start()
+
+    def answer(self, connection):
+        with connection, connection.makefile('rw') as stream:
+            command = stream.readline().strip()
+
+            if command == 'refresh':
+                with self.changed:
+                    self.requested += 1
+                    request = self.requested
+                    self.changed.notify_all()
+
+                    while self.completed < request:
+                        self.changed.wait()
+
+                stream.write('ok\n')
+            elif command == 'ping':
+                stream.write('pong\n')
+            else:
+                stream.write(f'unknown command: {command}\n')
+
+    def refresh(self, force=False):
+        '''
+        Fetch the uploads of every subscription, and the details of those
+        not cached, without building the video list.
+        '''
+        try:
+            channels = subscribed_channels(parse_config_file(), force=force)
+            all_uploads = concurrent_map(
+                lambda channel: channel[1].get(force=force, limit=channel[0]), channels
+            )
+
+            video_ids = [
+                item['snippet']['resourceId']['videoId']
+                for uploads in all_uploads for item in uploads
+            ]
+            missing = VideoDetails(video_id=video_ids).uncached()
+            VideoDetails(video_id=missing).get(force=True)
+        except Stopped:
+            pass
+        except (APIError, OSError) as error:
+            stderr.write(f'refresh failed: {error}\n')
 
+    def stop(self, *_):
+        # Runs as a signal handler, so only sets a flag: taking a lock the
+        # interrupted code holds would deadlock.
+        self.stopping = True
 
-class Cachable:
-    '''
-    Cache data on disk for faster lookups / persistent session state
-    '''
-    cache_base = os.path.join(XDG_CACHE_HOME, 'youtube_api_v3')
+    def work(self):
+        background.quiet = True
 
-    if not os.path.isdir(cache_base):
-        os.makedirs(cache_base)
+        while not YouTubeAPI.stopped.is_set():
+            with self.changed:
+                request = self.requested
 
-    def load_cache(self, cache_name, default=None):
-        cache_path = os.path.join(self.cache_base, cache_name)
-        cache_data = None
+            self.refresh(force=request > self.completed)
 
-        if os.path.isfile(cache_path):
-            with open(cache_path, 'rb') as cache:
-                try:
-                    cache_data = pickle.load(cache)
-                except EOFError:
-                    cache_data = None
+            with self.changed:
+                self.completed = request
+                self.changed.notify_all()
 
-        if cache_data is None:
-            return default
-        return cache_data
+                if self.requested == self.completed:
+                    self.changed.wait(self.poll_interval)
 
-    def save_cache(self, cache_name, data=None):
-        cache_path = os.path.join(self.cache_base, cache_name)
+    def run(self):
+        import signal
+        import socket
 
-        if data is not None:
-            with open(cache_path, 'wb') as cache:
-                pickle.dump(data, cache)
+        # Shut down cleanly on SIGTERM as well as on ^C.
+        signal.signal(signal.SIGTERM, self.stop)
 
+        if self.request('ping') is not None:
+            stderr.write('ytls daemon is already running\n')
+            return
 
-class LazyLoaded:
-    '''
-    The Google API lib is slooooooooooow to import,
-    this class lazily loads it with the lazy() method.
-    '''
-    _api = None
+        os.makedirs(self.cache_base, exist_ok=True)
 
-    def lazy(self):
-        if self._api is None:
-            with open('API_KEY', 'r') as key:
-                from googleapiclient.discovery import build
-                self._api = build(
-                    'youtube', 'v3', developerKey=key.read().strip()
-                )
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
 
-        return self._api
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socket_path)
+        server.listen()
 
+        threading.Thread(target=self.serve, args=(server,), daemon=True).start()
+        worker = threading.Thread(target=self.work, daemon=True)
+        worker.start()
 
-class YouTubeAPI(Cachable, LazyLoaded):
-    '''
-    Methods querying the YouTube API.
-    '''
-    max_duty_cycle = (1 / 3)
-    rate_limit = ((((24 * max_duty_cycle) * 60) * 60) / 10000)
+        try:
+            while not self.stopping and worker.is_alive():
+                worker.join(self.stop_interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            YouTubeAPI.stopped.set()
+            server.close()
+            os.remove(self.socket_path)
 
 
-class ChannelID(YouTubeAPI):
+class Prefetcher:
     '''
-    Get id of a channel.
+    Warm the cache while the REPL waits for input: refresh channels whose
+    time bucket has passed, then fetch details of cached uploads that are
+    not listed, and statistics older than `SETTINGS.STATS_MAX_AGE`.
+
+    Work is done one request at a time, only while the rate limit bucket
+    is at least half full, so a prefetch never holds up a fetch the user
+    asked for, and while more than `SETTINGS.QUOTA_RESERVE` units of the
+    daily quota are left. `cancel()` stops it before its next request.
     '''
     def __init__(self):
-        self.cache_name = 'channel_ids.pkl'
-
-    def get(self, username):
-        ids = self.load_cache(self.cache_name, default=dict())
-        channel_id = ids.get(username, None)
+        self.thread = None
+        self.cancelled = threading.Event()
+        self.idle_until = 0
 
-        stdout.write(f'fetching channel id for "{username}"...\n')
+    def start(self):
+        if time() < self.idle_until:
+            return
+        if self.thread is not None and self.thread.is_alive():
+            return
 
-        if channel_id is None:
-            query = self.lazy().channels().list(
-                part='contentDetails',
-                forUsername=username,
-            )
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self.run, args=(self.cancelled,), daemon=True)
+        self.thread.start()
 
-            response = query.execute()
+    def cancel(self):
+        self.cancelled.set()
 
-            channel_id = response['items'][-1]['id']
-            ids[username] = channel_id
+    def reset(self):
+        self.idle_until = 0
 
-            self.save_cache(self.cache_name, data=ids)
+    def may_continue(self, cancelled):
+        if cancelled.is_set():
+            return False
+        if QUOTA.remaining() <= SETTINGS.QUOTA_RESERVE:
+            return False
+        return YouTubeAPI.bucket.available() >= (YouTubeAPI.bucket.capacity / 2)
 
-        return channel_id
+    def run(self, cancelled):
+        background.quiet = True
 
+        try:
+            if self.prefetch(cancelled):
+                self.idle_until = time() + SETTINGS.PREFETCH_INTERVAL
+        except Exception as error:
+            # Never print a traceback over the prompt.
+            debug(f'prefetch failed: {error!r}')
+
+    def prefetch(self, cancelled):
+        '''
+        Return True if everything was prefetched.
+        '''
+        video_ids = []
+        subscriptions = parse_config_file()
+
+        channel_ids, missing = SUBSCRIPTIONS.cached(
+            [user for _, _, user in subscriptions if not is_channel_id(user)]
+        )
+        missing = set(missing)
+        found = dict()
 
-class ChannelUploads(YouTubeAPI):
-    '''
-    Get uploads from a channel.
-    '''
-    def __init__(self, username=None, channel_id=None, timestamp=''):
-        self.channel_id = channel_id
-        self.uploads_id = re.sub('^UC', 'UU', self.channel_id)
-        self.username = username
+        try:
+            for subscription in subscriptions:
+                if not self.may_continue(cancelled):
+                    return False
 
-        self.cache_name = os.path.join(
-            f'{self.channel_id}.{timestamp.ljust(10, "0")}.pkl'
-        )
+                user = subscription[2]
 
-    def get(self, force=False):
-        uploads = self.load_cache(self.cache_name, default=list())
+                # Unknown usernames are looked up one at a time as well.
+                if is_channel_id(user):
+                    channel_id = user
+                elif user in missing:
+                    channel_id = found[user] = SUBSCRIPTIONS.fetch(user)
+                else:
+                    channel_id = channel_ids.get(user)
 
-        stdout.write(f'fetching videos from "{self.username}"...\n')
+                if not channel_id:
+                    continue
 
-        if not uploads or force:
-            query = self.lazy().playlistItems().list(
-                part='contentDetails, snippet',
-                playlistId=self.uploads_id,
-                maxResults=SETTINGS.VIDS_REQUESTED_PER_CHANNEL,
-            )
+                num, channel = subscribed_channel(subscription, channel_id)
+                channel.get(limit=num)
+                state = channel.load_cache(channel.cache_name, default=dict())
+                video_ids.extend(video_id(item) for item in state.get('items', []))
+        finally:
+            SUBSCRIPTIONS.remember({u: i for u, i in found.items() if i is not False})
 
-            response = query.execute()
-            # sleep(self.rate_limit)
+        details = VideoDetails(video_id=video_ids)
+        cached = details.load_many(details.cache_name(v) for v in video_ids)
+        stale = time() - SETTINGS.STATS_MAX_AGE
 
-            uploads = response['items']
-            self.save_cache(self.cache_name, data=uploads)
+        wanted = [
+            v for v in video_ids
+            if cached.get(details.cache_name(v), {'fetched': 0})['fetched'] < stale
+        ]
 
-        return uploads
+        for start in range(0, len(wanted), VideoDetails.max_ids_per_request):
+            if not self.may_continue(cancelled):
+                return False
 
+            VideoDetails(
+                video_id=wanted[start:start + VideoDetails.max_ids_per_request]
+            ).get(force=True)
 
-class VideoDetails(YouTubeAPI):
-    '''
-    Get information about a specific video.
-    '''
-    def __init__(self, video_id=None, timestamp=''):
-        if type(video_id) == 'list':
-            self.video_id = ', '.join(video_id)
-        else:
-            self.video_id = video_id
+        return True
 
-        self.cache_name = os.path.join(
-            f'{self.video_id}.{timestamp.ljust(10, "0")}.pkl'
-        )
 
-    def get(self, force=False):
-        stats = self.load_cache(self.cache_name, default=list())
+def is_channel_id(user):
+    return user.startswith('UC') and len(user) == 24
 
-        if not stats or force:
-            query = self.lazy().videos().list(
-                part='statistics, contentDetails, snippet',
-                id=self.video_id,
-            )
 
-            response = query.execute()
-            # sleep(self.rate_limit)
+def subscribed_channels(subscriptions, force=False):
+    '''
+    Return a (number of videos, ChannelUploads) pair for each subscription.
 
-            stats = response['items']
-            self.save_cache(self.cache_name, data=stats)
+    Subscriptions by username are resolved to channel ids all at once.
+    Usernames without a channel are skipped.
+    '''
+    channels = []
 
-        return stats
+    channel_ids = SUBSCRIPTIONS.resolve(
+        [user for _, _, user in subscriptions if not is_channel_id(user)],
+        force=force,
+    )
 
+    for subscription in subscriptions:
+        cl, num, user = subscription
 
-class Video:
-    def __init__(self, video):
-        self.id = video['resourceId']['videoId']
-        self.url = f'https://youtube.com/watch?v={self.id}'
-        self.channel = video['channelTitle']
-        self.title = video["title"]
-        self.pubdate = video['publishedAt'][2:10]
-        self.pubtime = video['publishedAt'][11:16]
-        self.viewed = self.id in VIEWS.get()
+        if is_channel_id(user):
+            channel_id = user
+        else:
+            channel_id = channel_ids.get(user)
 
-        stdout.write(f'fetching details of video "{self.title}"...\n')
-        self._details = VideoDetails(video_id=self.id).get(force=False)
+        if channel_id is None:
+            if user in channel_ids and not getattr(background, 'quiet', False):
+                stderr.write(f'no channel named "{user}"\n')
+            continue
 
-        self.description = self._details[0]['snippet'].get('description', None)
-        self.comments = int(self._details[0]['statistics'].get('commentCount', 0))
-        self.dislikes = int(self._details[0]['statistics'].get('dislikeCount', 0))
-        self.likes = int(self._details[0]['statistics'].get('likeCount', 0))
-        self.views = int(self._details[0]['statistics'].get('viewCount', 0))
+        channels.append(subscribed_channel(subscription, channel_id))
 
-        # pprint(self._details)
-        # exit(7)
+    return channels
 
 
-class Actions:
+def subscribed_channel(subscription, channel_id):
     '''
-    Doing stuff to video objects.
+    Return a (number of videos, ChannelUploads) pair for `subscription`.
     '''
-    def __init__(self, video):
-        self.video = video
+    cl, num, user = subscription
 
-    def message(self, _action):
-        stdout.write(' '.join([
-            f'{_action}:',
-            colored(
-                viewed=False,
-                color_key="channel",
-                string=f'{self.video.channel}:',
-            ),
-            f'{self.video.title}\n',
-        ]))
+    timestamp = {
+        'h': strftime('%Y%m%d%H'),
+        'd': strftime('%Y%m%d'),
+        'w': strftime('%Y%m%U'),
+        'm': strftime('%Y%m'),
+        'y': strftime('%Y'),
+    }.get(
+        cl, ''.join((strftime('%Y%m%d'), str(int(strftime('%H')) // 4)))
+    )
 
-    def download(self):
-        if which('youtube-dl'):
-            self.message('downloading')
-            os.system(' '.join([
-                f'cd {shellescape(XDG_DOWNLOADS_DIR)}',
-                f'&& youtube-dl {shellescape(self.video.url)}',
-            ]))
+    return int(num), ChannelUploads(
+        username=user,
+        channel_id=channel_id,
+        timestamp=timestamp,
+    )
 
-    def rip_audio(self, audio_format):
-        if which('youtube-dl'):
-            audio_formats = ['aac', 'flac', 'mp3', 'm4a', 'opus', 'vorbis', 'wav']
 
-            if audio_format not in audio_formats:
-                audio_format = 'mp3'
+def get_videos(subscriptions, force=False):
+    channels = subscribed_channels(subscriptions, force=force)
 
-            self.message(f'ripping {audio_format}')
-            os.system(' '.join([
-                f'cd {shellescape(XDG_DOWNLOADS_DIR)}',
-                f'&& youtube-dl --extract-audio --audio-format {audio_format}',
-                shellescape(self.video.url),
-            ]))
+    # Channels are fetched concurrently, but results come back in
+    # subscription order.
+    with METRICS.timer('uploads fetch'):
+        all_uploads = concurrent_map(
+            lambda channel: channel[1].get(force=force, limit=channel[0]), channels
+        )
 
-    def open_in_browser(self):
-        if os.name == 'posix':
-            if which('pidof'):
-                def browser_pid():
-                    return [
-                        p for p in
-                        os.popen(' '.join(['pidof', shellescape(BROWSER)]))
-                        .read().strip().split()
-                    ] or None
-
-                if browser_pid() is None:
-                    os.system(
-                        f'bash -c -- "1>&2 2>/dev/null {BROWSER}& disown"'
-                    )
-
-                new_tab_cmd = {
-                    'firefox': 'firefox -new-tab %s',
-                }
-
-                while browser_pid() is None:
-                    sleep(0.1)
-
-                self.message('opening')
-                os.system(new_tab_cmd.get(BROWSER, '#') % shellescape(self.video.url))
-                self.mark_as_watched()
-        else:
-            stderr.write(f'not yet implemented for os type: {os.name}\n')
+    items = []
 
-    def open_in_mpv(self):
-        os.system('youtube-mpv {}' % shellescape(self.video.url))
+    for uploads in all_uploads:
+        items.extend(item['snippet'] for item in uploads)
 
-    def mark_as_watched(self):
-        VIEWS.add(self.video.id)
-        self.message('marked as watched')
+    video_ids = [item['resourceId']['videoId'] for item in items]
+    VIEWS.get()
 
-    def list(self, index, search_string=None):
-        if self.video.viewed and SETTINGS.HIDE:
-            return
+    status(f'fetching details of {len(video_ids)} videos...')
+    with METRICS.timer('details fetch'):
+        details = VideoDetails(video_id=video_ids).get(force=False)
 
-        title = self.video.title
-        title = re.sub(f'[^{string.printable}]', '_', title)
+    for item in items:
+        yield Video(item, details=details.get(item['resourceId']['videoId'], dict()))
 
-        if search_string is not None:
-            results = re.search(search_string, title, flags=re.IGNORECASE)
-            if not results:
-                return
 
-        index_column_width = (len(str(len(VIDEOS))))
+def stream_videos(subscriptions, force=False):
+    '''
+    Like `get_videos()`, but yield a (channels done, channels, index of
+    the subscription, videos) tuple as soon as each channel's uploads are
+    in, in the order channels finish.
+
+    Unknown channel ids are looked up by the same worker that then fetches
+    the channel's uploads, rather than all up front. Videos come with the
+    statistics cached for them. Statistics not cached are fetched all at
+    once after the last channel is done, and set on the videos already
+    yielded.
+
+    Looking up channel ids is timed per worker. The uploads are timed from
+    the first request to the last channel done, whatever the caller does
+    in between.
+    '''
+    from concurrent.futures import ThreadPoolExecutor, as_completed
 
-        max_title_len = (cols - ((index_column_width + 1)
-                                 + ((len(self.video.pubdate) + 1))
-                                 + ((len(self.video.pubtime) + 1))
-                                 + ((len(self.video.channel) + 2))
-                                 + ((len(self.video.url) * SETTINGS.SHOW_URL) + 2)
-                                 ))
+    with METRICS.timer('channel ids'):
+        channel_ids, missing = SUBSCRIPTIONS.cached(
+            [user for _, _, user in subscriptions if not is_channel_id(user)],
+            force=force,
+        )
+    missing = set(missing)
+    found = dict()
 
-        debug(f'cols={cols}, title={len(self.video.title)} max={max_title_len}')
+    for _, _, user in subscriptions:
+        if user not in missing and user in channel_ids and channel_ids[user] is None:
+            stderr.write(f'no channel named "{user}"\n')
 
-        def writer(color_key, string):
-            stdout.write(colored(
-                viewed=self.video.viewed,
-                color_key=color_key,
-                string=string,
-            ))
+    def uploads(subscription):
+        user = subscription[2]
 
-        if max_title_len < 6:
-            print('screen not wide enough')
-            return
-        elif (len(self.video.title) > max_title_len):
-            title = f' {title[:(max_title_len)]}… '
+        if is_channel_id(user):
+            channel_id = user
+        elif user in missing:
+            with METRICS.timer('channel ids'):
+                channel_id = found[user] = SUBSCRIPTIONS.fetch(user)
         else:
-            title = f' {title}' + (' ' * (max_title_len - (len(self.video.title) - 1))) + ' '
+            channel_id = channel_ids.get(user)
 
-        try:
-            if search_string is not None:
-                results = re.search(search_string, title, flags=re.IGNORECASE)
-                matched_separator = results.group(0)
-                parts = re.split(matched_separator, title, 1)
-                title = f'{parts[0]}\033[31;1m{matched_separator}\033[0m{parts[1]}'
-        except AttributeError:
-            title = title
-
-        writer('index', f'{str(index).ljust(index_column_width)} ')
-        writer('timestamp', ' '.join([self.video.pubdate, self.video.pubtime]))
-        writer('channel',   f' {self.video.channel}:')
-        writer('text', title)
-        if SETTINGS.SHOW_URL:
-            writer('url', f'{self.video.url}\n')
-        else:
-            stdout.write('\n')
+        if not channel_id:
+            return []
 
+        num, channel = subscribed_channel(subscription, channel_id)
+        return channel.get(force=force, limit=num)
 
-class Sorted:
-    '''
-    Chainable sort operations for Video objects
+    videos = []
+    cached = set()
+    VIEWS.get()
 
-    the `.get()` method breaks the chain and executes the sort.
-    '''
-    def __init__(self, videos=list(), keychain=list()):
-        self.videos = videos
-        self.keychain = keychain
+    started = perf_counter()
+    finished = []
 
-    def __repr__(self):
-        return f'Sorted(videos={self.videos}, keychain={self.keychain})'
+    with ThreadPoolExecutor(
+        max_workers=max(SETTINGS.WORKERS, 1),
+        initializer=setattr, initargs=(background, 'quiet', True),
+    ) as pool:
+        futures = {
+            pool.submit(uploads, subscription): index
+            for index, subscription in enumerate(subscriptions)
+        }
 
-    def get(self):
-        def int_or_ord(char):
-            if type(char) == str:
-                char = ord(char)
-            return str(char)
+        for future in futures:
+            future.add_done_callback(lambda _: finished.append(perf_counter()))
 
-        return sorted(
-            self.videos,
-            key=lambda v: int(''.join((
-                int_or_ord(c) for c in ''.join((
-                    key_function(v) for key_function in self.keychain))))))
+        for done, channel_uploads in enumerate(as_completed(futures), 1):
+            items = [item['snippet'] for item in channel_uploads.result()]
+            details = VideoDetails(
+                video_id=[item['resourceId']['videoId'] for item in items]
+            ).cached()
+            cached.update(details)
 
-    def where(self, condition: callable):
-        self.videos = list(filter(condition, self.videos))
-        return Sorted(
-            videos=self.videos,
-            keychain=self.keychain,
-        )
+            batch = [
+                Video(item, details=details.get(item['resourceId']['videoId'], dict()))
+                for item in items
+            ]
+            videos.extend(batch)
 
-    @property
-    def by_date(self):
-        self.keychain.append(
-            lambda v: re.sub(r'[^0-9]', '', v.pubdate)
-        )
-        return Sorted(
-            videos=self.videos,
-            keychain=self.keychain,
-        )
+            yield done, len(futures), futures[channel_uploads], batch
 
-    @property
-    def by_time(self):
-        self.keychain.append(
-            lambda v: re.sub(r'[^0-9]', '', v.pubtime)
-        )
-        return Sorted(
-            videos=self.videos,
-            keychain=self.keychain,
-        )
+    METRICS.record('uploads fetch', max(finished, default=started) - started)
+    SUBSCRIPTIONS.remember({u: i for u, i in found.items() if i is not False})
 
-    @property
-    def by_user(self):
-        self.keychain.append(
-            lambda v: v.channel
-        )
-        return Sorted(
-            videos=self.videos,
-            keychain=self.keychain
-        )
+    missing = [video for video in videos if video.id not in cached]
 
-    @property
-    def by_likes(self):
-        self.keychain.append(
-            lambda v: str(v.likes).zfill(12)
-        )
-        return Sorted(
-            videos=self.videos,
-            keychain=self.keychain
-        )
+    with METRICS.timer('details fetch'):
+        details = VideoDetails(video_id=[video.id for video in missing]).get(force=False)
 
-    @property
-    def by_views(self):
-        self.keychain.append(
-            lambda v: str(v.views).zfill(12)
-        )
-        return Sorted(
-            videos=self.videos,
-            keychain=self.keychain
-        )
+    for video in missing:
+        video.update(details.get(video.id))
 
 
-class ViewHistory(Cachable):
+def fetch_videos(subscriptions, force=False):
     '''
-    Keep track of which videos have been viewed.
+    Return the latest videos, sorted by date if `SETTINGS.STREAM` is set,
+    in which case they are shown as they come in.
     '''
-    def __init__(self):
-        self.cache_name = 'view_history.pkl'
-        self.views = set()
-
-    def add(self, video_id):
-        self.views.add(video_id)
-        self.save_cache(self.cache_name, data=self.views)
+    if not SETTINGS.STREAM:
+        return list(get_videos(subscriptions, force=force))
 
-    def get(self):
-        self.views = self.load_cache(self.cache_name, default=set())
-        return self.views
+    width, height = os.get_terminal_size(0)
+    live = LiveListing(width, height)
+    started = perf_counter()
 
+    for done, channels, subscription, videos in stream_videos(subscriptions, force=force):
+        if done == 1:
+            METRICS.record('time to first row', perf_counter() - started)
 
-def get_videos(subscriptions, force=False):
-    for subscription in subscriptions:
-        cl, num, user = subscription
+        live.add(videos, subscription)
 
-        if user.startswith('UC') and len(user) == 24:
-            channel_id = user
+        if done == channels:
+            live.progress = f'fetched {channels} channels, fetching details...'
+            live.draw()
         else:
-            channel_id = SUBSCRIPTIONS.get(user)
-
-        timestamp = {
-            'h': strftime('%Y%m%d%H'),
-            'd': strftime('%Y%m%d'),
-            'w': strftime('%Y%m%U'),
-            'm': strftime('%Y%m'),
-            'y': strftime('%Y'),
-        }.get(
-            cl, ''.join((strftime('%Y%m%d'), str(int(strftime('%H')) // 4)))
-        )
-
-        uploads = ChannelUploads(
-            username=user,
-            channel_id=channel_id,
-            timestamp=timestamp,
-        ).get(force=force)
+            live.update(f'fetched {done} of {channels} channels, {len(live.videos)} videos')
 
-        count = 0
+    live.clear()
+    QUOTA.warn_unwarned()
 
-        for item in uploads:
-            if count == int(num):
-                break
-            count += 1
+    return live.videos
 
-            video = Video(item['snippet'])
-            # video = item['snippet']
-            # print(video)
 
-            yield video
+def list_videos(videos, **kwargs):
+    RENDERER.list(videos, cols, **kwargs)
 
 
-def list_videos(videos, **kwargs):
-    for index, video in enumerate(VIDEOS):
-        Actions(video).list(index, **kwargs)
+config_comment = re.compile('#.*$')
+config_subscription = re.compile(r'^[hdmw]\t[0-9]+\t.*$')
+config_keyword = re.compile(r'^[ a-zA-Z0-9()|\\?\[\]{}^$._-]+$')
 
 
-def parse_config_file():
+@lru_cache(maxsize=1)
+def read_config_file(path, mtime_ns, size):
+    '''
+    Return the subscriptions and keywords in `path`, as it was at `mtime_ns`.
+    '''
     sublist = []
-    with open('subscriptions.conf', 'r') as subs:
-        for line in (l.strip() for l in subs.readlines()):
-            if line.startswith('#'):
-                continue
+    keywords = set()
 
-            if re.match(rf'^[{string.whitespace}]*$', line):
+    with open(path, 'r') as subs:
+        for line in (l.strip() for l in subs.readlines()):
+            if line.startswith('#') or not line:
                 continue
 
-            if re.match(r'^[hdmw]\t[0-9]+\t.*$', line):
+            if config_subscription.match(line):
                 if '#' in line:
-                    line = re.sub('#.*$', '', line).strip()
-                line = line.split('\t')
-                sublist.append(line)
+                    line = config_comment.sub('', line).strip()
+                sublist.append(tuple(line.split('\t')))
                 continue
 
-            if re.match(r'^[ a-zA-Z0-9()|\\?\[\]{}^$._-]+$', line):
-                SETTINGS.KEYWORDS.add(line.strip())
+            if config_keyword.match(line):
+                keywords.add(line)
                 continue
 
-            # print(line)
-        # exit()
+    return tuple(sublist), frozenset(keywords)
+
+
+def parse_config_file(path='subscriptions.conf'):
+    '''
+    Return the subscriptions in `path`, and set `SETTINGS.KEYWORDS` to
+    its keywords. The file is only read again once it has changed.
+
+    Keywords that are not valid regular expressions are left out of
+    `SETTINGS.KEYWORDS_PATTERN`, with a warning.
+    '''
+    with METRICS.timer('config parse'):
+        stat = os.stat(path)
+        sublist, keywords = read_config_file(path, stat.st_mtime_ns, stat.st_size)
+
+    # Left for the main thread, which can warn about invalid keywords.
+    if keywords != SETTINGS.KEYWORDS and not getattr(background, 'quiet', False):
+        SETTINGS.KEYWORDS = set(keywords)
+        SETTINGS.KEYWORDS_PATTERN = None
+        valid = []
+
+        for keyword in sorted(keywords):
+            try:
+                compile_search(keyword)
+            except re.error as error:
+                stderr.write(f'invalid keyword "{keyword}": {error}\n')
+            else:
+                valid.append(keyword)
+
+        if valid:
+            pattern = f'({"|".join(valid)})'
+
+            try:
+                compile_search(pattern)
+            except re.error as error:
+                # Keywords can be valid alone but not together, e.g. when
+                # one starts with inline flags like `(?i)`.
+                stderr.write(f'invalid keywords: {error}\n')
+            else:
+                SETTINGS.KEYWORDS_PATTERN = pattern
+
+    return list(sublist)
+
 
-    return sublist
+class StartupProfile:
+    '''
+    Time each step from importing ytls to showing the first prompt, which
+    should take no more than `target` seconds. See --startup-profile.
+    '''
+    target = 0.05
+
+    def __init__(self, started):
+        self.started = self.last = started
+        self.steps = []
+
+    def mark(self, step):
+        now = perf_counter()
+        self.steps.append((step, now - self.last))
+        self.last = now
+
+    def report(self):
+        total = self.last - self.started
+
+        for step, seconds in self.steps:
+            stderr.write(f'{step:<24} {seconds * 1000:>8.1f}ms\n')
+        stderr.write(f'{"time to prompt":<24} {total * 1000:>8.1f}ms '
+                     f'(target {self.target * 1000:.0f}ms)\n')
+
+
+SETTINGS = Settings()
+METRICS = Metrics()
+SUBSCRIPTIONS = ChannelID()
+QUOTA = Quota()
+VIEWS = ViewHistory()
+CACHE = CacheManager()
+PREFETCHER = Prefetcher()
+DAEMON = Daemon()
+DOWNLOADS = Downloads()
+RENDERER = Renderer()
+SNAPSHOT = Snapshot()
+SEARCH_INDEX = SearchIndex()
+VIDEOS = []
+STARTUP = StartupProfile(IMPORT_STARTED)
+STARTUP.mark('import ytls')
 
 
 if __name__ == '__main__':
-    SETTINGS = Settings()
-    SUBSCRIPTIONS = ChannelID()
-    VIEWS = ViewHistory()
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--daemon', action='store_true',
+        help='keep the cache warm in the background instead of starting the REPL',
+    )
+    parser.add_argument(
+        '--startup-profile', action='store_true',
+        help='print how long each step before the first prompt took',
+    )
+    parser.add_argument(
+        '--trace', metavar='FILE',
+        help='append the time taken by each stage of each command to FILE, as JSON lines',
+    )
+    args = parser.parse_args()
+
+    if args.trace:
+        SETTINGS.TRACE_FILE = args.trace
+    STARTUP.mark('parse arguments')
+
+    import atexit
+    atexit.register(QUOTA.save)
+
+    if args.daemon:
+        DAEMON.run()
+        raise SystemExit
+
+    # Line editing for input().
+    import readline
+
+    STARTUP.mark('import readline')
+
+    # Nothing here is needed for the prompt, so it is done in the background.
+    CACHE.prune_in_background()
+    threading.Thread(target=DOWNLOADS.start, daemon=True).start()
     # VIDEOS = list(get_videos(parse_config_file()))
 
     # Actions(VIDEOS[0]).get_video_details()
 
+    STARTUP.mark('start background tasks')
+
+    # Pick up where the last session left off, until the next fetch.
+    VIDEOS, saved = SNAPSHOT.load()
+
+    if VIDEOS:
+        cols, _ = os.get_terminal_size(0)
+        list_videos(VIDEOS)
+        stdout.write(f'{len(VIDEOS)} videos as of {strftime("%Y-%m-%d %H:%M", localtime(saved))}, '
+                     f'f to fetch the latest\n')
+
+    STARTUP.mark('restore last video list')
+
+    profile = None
+
     while True:
+        if profile is not None:
+            profile.disable()
+
+            import pstats
+
+            pstats.Stats(profile, stream=stdout).sort_stats('cumulative').print_stats(25)
+            profile = None
+
+        PREFETCHER.start()
+
+        if args.startup_profile:
+            STARTUP.mark('start prefetching')
+            STARTUP.report()
+            args.startup_profile = False
+
         try:
             choice = input(f'\033[1mYTLS $\033[0m ').strip()
         except (EOFError, KeyboardInterrupt):
             break
+        finally:
+            PREFETCHER.cancel()
 
         cols, _ = os.get_terminal_size(0)
 
+        if choice.startswith('profile '):
+            import cProfile
+
+            choice = choice[len('profile '):].strip()
+            profile = cProfile.Profile()
+            profile.enable()
+
         if choice in ('?', 'help'):
             stdout.write('''
 CATAGORY
@@ -557,16 +3158,27 @@ GENERAL
 ?       help         display this message
 q       quit         quit
 f       fetch        fetch latest videos from YouTube (or from local cache)
+f force fetch force  fetch latest videos from YouTube, ignoring the cache
+s       stream       when fetching, show videos as they come in, and sort
+                     them by date
+S       nostream     when fetching, show videos once all are in, in the
+                     order of subscriptions.conf (the default)
+refresh              have the daemon (ytls --daemon) fetch the latest videos
+                     from YouTube, then fetch them from the cache
 n N     number N     when fetching, display N videos (5 by default)
+p N     parallel N   when fetching, make up to N requests at a time
+                     (8 by default)
 
 
 VIDEOS
 ==============================================================================
 a N F   audio N F    rip audio from video N (optionally; in format F
                      (mp3 by default))
-dl N    download N   download video N
+dl N    download N   download video N (in the background)
 o N     open N       open video N in $BROWSER
 w N     watched N    mark video N as watched
+jobs                 show queued, running and failed downloads
+jobs clear           forget finished and failed downloads
 
 
 LISTING
@@ -574,11 +3186,35 @@ LISTING
 l       list         list videos
 d       date         sort by upload date
 c       channel      sort by channel name
+v       views        sort by view count
+L       likes        sort by like count
+C       comments     sort by comment count
+r       reverse      reverse the order of the list
 h       hide         hide watched videos
 H       nohide       show watched videos
 u       url          show url
 U       nourl        hide url
 g RE    grep RE      filter videos with regex RE
+ga RE   grepall RE   filter videos with regex RE, matching the channel name
+                     and description as well as the title
+k       keywords     filter videos with the keywords in subscriptions.conf
+
+
+CACHE
+==============================================================================
+cache stats          show what is cached, and how much space it takes
+cache prune          delete expired entries, then least recently used ones
+                     until the cache fits its size limit
+quota                show how much of the daily API quota has been used
+
+
+PROFILING
+==============================================================================
+stats                show the time spent in each stage of fetching, sorting
+                     and listing videos, and cache hits and misses
+stats reset          start counting from zero
+profile CMD          run CMD under cProfile (in this thread only), then show
+                     the functions it spent the most time in
 
 
 ''')
@@ -590,6 +3226,38 @@ g RE    grep RE      filter videos with regex RE
         if choice in ('q', 'quit'):
             break
 
+        if re.match(r'^p(arallel)?\s[0-9]+$', choice):
+            SETTINGS.WORKERS = int(choice.split()[1])
+            continue
+
+        if choice == 'jobs':
+            DOWNLOADS.list()
+            continue
+
+        if choice == 'jobs clear':
+            DOWNLOADS.clear()
+            continue
+
+        if choice == 'cache stats':
+            CACHE.stats()
+            continue
+
+        if choice == 'cache prune':
+            stdout.write(f'deleted {CACHE.prune()} cache entries\n')
+            continue
+
+        if choice == 'quota':
+            QUOTA.report()
+            continue
+
+        if choice == 'stats':
+            METRICS.report()
+            continue
+
+        if choice == 'stats reset':
+            METRICS.reset()
+            continue
+
         if choice in ('h', 'hide'):
             SETTINGS.HIDE = True
             list_videos(VIDEOS)
@@ -610,48 +3278,102 @@ g RE    grep RE      filter videos with regex RE
             list_videos(VIDEOS)
             continue
 
+        if choice in ('s', 'stream'):
+            SETTINGS.STREAM = True
+            continue
+
+        if choice in ('S', 'nostream'):
+            SETTINGS.STREAM = False
+            continue
+
         if choice in ('l', 'ls', 'list'):
             list_videos(VIDEOS)
             continue
 
-        if choice.startswith(('g', 'grep')):
-            _, _, pattern = choice.partition(' ')
-            list_videos(VIDEOS, search_string=pattern)
+        if choice.startswith(('ga ', 'grepall ', 'g ', 'grep ')):
+            command, _, pattern = choice.partition(' ')
+
+            if command in ('ga', 'grepall'):
+                fields = SearchIndex.fields
+            else:
+                fields = ('title',)
+
+            try:
+                list_videos(VIDEOS, search_string=pattern, fields=fields)
+            except re.error as error:
+                stderr.write(f'invalid pattern: {error}\n')
             continue
 
         if choice in ('k', 'keywords'):
-            list_videos(VIDEOS, search_string=f'({"|".join(SETTINGS.KEYWORDS)})')
+            # Keywords are read with the subscriptions, which a list
+            # restored from the snapshot was not fetched with.
+            parse_config_file()
+            list_videos(VIDEOS, search_string=SETTINGS.KEYWORDS_PATTERN)
             continue
 
         if choice.startswith(('f ', 'fetch ')) and choice.endswith(('f', 'force')):
-            VIDEOS = list(get_videos(parse_config_file(), force=True))
+            VIDEOS = fetch_videos(parse_config_file(), force=True)
+            SNAPSHOT.save(VIDEOS)
+            PREFETCHER.reset()
+            list_videos(VIDEOS)
+            continue
+
+        if choice == 'refresh':
+            if DAEMON.request('refresh') is None:
+                stderr.write('no daemon running, fetching here\n')
+                VIDEOS = fetch_videos(parse_config_file(), force=True)
+            else:
+                VIDEOS = fetch_videos(parse_config_file())
+            SNAPSHOT.save(VIDEOS)
+            PREFETCHER.reset()
             list_videos(VIDEOS)
             continue
 
         if choice in ('f', 'fetch'):
-            VIDEOS = list(get_videos(parse_config_file()))
+            VIDEOS = fetch_videos(parse_config_file())
+            SNAPSHOT.save(VIDEOS)
+            PREFETCHER.reset()
             list_videos(VIDEOS)
             continue
 
         if choice in ('c', 'channel'):
-            VIDEOS = list(Sorted(videos=VIDEOS, keychain=list())
-                          .by_user
-                          .get())
+            VIDEOS = (Sorted(VIDEOS)
+                      .by_user
+                      .get())
             list_videos(VIDEOS)
             continue
 
         if choice in ('d', 'date'):
-            VIDEOS = list(Sorted(videos=VIDEOS, keychain=list())
-                          .by_date
-                          .by_time
-                          .get())
+            VIDEOS = (Sorted(VIDEOS)
+                      .by_date
+                      .by_time
+                      .get())
             list_videos(VIDEOS)
             continue
 
         if choice in ('v', 'views'):
-            VIDEOS = list(Sorted(videos=VIDEOS, keychain=list())
-                          .by_views
-                          .get())
+            VIDEOS = (Sorted(VIDEOS)
+                      .by_views
+                      .get())
+            list_videos(VIDEOS)
+            continue
+
+        if choice in ('L', 'likes'):
+            VIDEOS = (Sorted(VIDEOS)
+                      .by_likes
+                      .get())
+            list_videos(VIDEOS)
+            continue
+
+        if choice in ('C', 'comments'):
+            VIDEOS = (Sorted(VIDEOS)
+                      .by_comments
+                      .get())
+            list_videos(VIDEOS)
+            continue
+
+        if choice in ('r', 'reverse'):
+            VIDEOS = VIDEOS[::-1]
             list_videos(VIDEOS)
             continue
 
@@ -660,7 +3382,7 @@ g RE    grep RE      filter videos with regex RE
         #     VIDEOS = (Sorted(VIDEOS)
         #               .by_user
         #               .by_date
-        #               .by_views
+        #               .by_views.reverse
         #               .get())
         #     list_videos(VIDEOS)
         #     continue
@@ -682,26 +3404,30 @@ g RE    grep RE      filter videos with regex RE
         else:
             continue
 
-        choice = [int(c) for c in choice]
+        videos = [VIDEOS[int(c)] for c in choice if int(c) in range(0, len(VIDEOS))]
 
-        for c in choice:
-            if c not in range(0, len(VIDEOS)):
-                continue
+        # Opened or watched all at once.
+        if action.startswith('o'):
+            Actions.open_all_in_browser(videos)
+            continue
+
+        if action.startswith('w'):
+            Actions.mark_all_as_watched(videos)
+            continue
 
+        for video in videos:
             if action.startswith('a'):
-                Actions(VIDEOS[c]).rip_audio(audio_format)
+                Actions(video).rip_audio(audio_format)
 
             elif action.startswith('d'):
-                Actions(VIDEOS[c]).download()
+                Actions(video).download()
 
             elif action.startswith('m'):
-                Actions(VIDEOS[c]).open_in_mpv()
-
-            elif action.startswith('o'):
-                Actions(VIDEOS[c]).open_in_browser()
-
-            elif action.startswith('w'):
-                Actions(VIDEOS[c]).mark_as_watched()
+                Actions(video).open_in_mpv()
 
             else:
                 raise Exception
+
+    # Restore the list as last sorted in the next session.
+    if VIDEOS:
+        SNAPSHOT.save(VIDEOS)